@@ -3,18 +3,17 @@ Various modular functions that depend on each other for
 data processing, the data being NAO's joint sensor
 measurements for motion analysis.
 '''
-from time import sleep, time
-from naoqi import ALProxy
+from time import sleep
+import nao_proxy
 from motion_analyzer import NAOMotionDataAnalyzer as MA
+from nao_joints import JOINT_NAMES
+from report_parser import parse_reports, COMMAND
+from resampling import resample
+from joint_sampler import JointSampler, record
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as path_effects
 
-JOINT_NAMES = ['HeadYaw', 'HeadPitch', 'LShoulderPitch', 'LShoulderRoll', 'LElbowYaw', 'LElbowRoll',
-               'LWristYaw', 'LHipYawPitch', 'LHipRoll', 'LHipPitch', 'LKneePitch', 'LAnklePitch', 'LAnkleRoll',
-               'RHipYawPitch', 'RHipRoll', 'RHipPitch', 'RKneePitch', 'RAnklePitch', 'RAnkleRoll',
-               'RShoulderPitch', 'RShoulderRoll', 'RElbowYaw', 'RElbowRoll', 'RWristYaw', 'LHand', 'RHand']
-
 # ------ D E V E L O P M E N T ------- #
 
 
@@ -24,10 +23,10 @@ def proxy(module, ip='127.0.0.1', port=9559):
     NAOqi module.
 
     :param module: Name of module. Must be a string.
-    :return: A proxy to module, running on IP 127.0.0.1
-             and port 9559.
+    :return: A shared caching proxy to module, running on
+             IP 127.0.0.1 and port 9559.
     '''
-    return ALProxy(module, ip, port)
+    return nao_proxy.proxy(module, ip, port)
 
 
 # Start the proxies.
@@ -52,36 +51,38 @@ def print_behaviors():
 
 
 def split_reports(reports):
-    # Split each report by new line delimiter,
-    # also removing first two header lines.
-    split = [report.split('\n')[2:] for report in reports]
-    # Get rid of irrelevant lines in each report.
-    for i in xrange(len(split)):
-        for j in reversed(xrange(len(split[i]))):
-            if 'Tasks' in split[i][j]:
-                break
-        split[i] = split[i][:j]
-    # Split each line of each report into its data.
-    split = [[line.split() for line in report] for report in split]
-    # Make the data dictionary.
-    angles = {body_part: [] for body_part in JOINT_NAMES}
-    # Add the angles.
-    for report in split:
-        for line in report:
-            angles[line[0]].append(float(line[2]))
-    return angles
+    '''
+    Collects the commanded angle of every joint
+    across a list of reports. Malformed reports are skipped.
+
+    :param reports: List of getSummary() report strings.
+    :return: Dictionary of joint names to lists of angles.
+    '''
+    values, kept = parse_reports(reports)
+    return {JOINT_NAMES[i]: values[:, i, COMMAND].tolist()
+            for i in xrange(len(JOINT_NAMES))}
+
 
+def process(data, rate=50.0):
+    '''
+    Runs each behavior in turn, sampling NAO's commanded
+    joint angles at a fixed rate while it runs.
 
-def process(data):
-    reports = set()
-    i = 1
-    for b in data:
-        print str(i) + ') ' + b
+    :param data: Behaviors to run.
+    :param rate: Samples per second.
+    :return: Dictionary of joint names to lists of angles.
+    '''
+    angles = {body_part: [] for body_part in JOINT_NAMES}
+    for i, b in enumerate(data):
+        print str(i + 1) + ') ' + b
         behavior_proxy.post.runBehavior(b)
         sleep(0.1)  # Wait 100ms for latency
-        while behavior_proxy.isBehaviorRunning(b):
-            reports.add(motion_proxy.getSummary())
-    return split_reports(list(reports))
+        sampler = JointSampler(motion_proxy, rate=rate, fields=('command',))
+        sampler.start()
+        times, values = record(sampler, lambda: behavior_proxy.isBehaviorRunning(b))
+        for j in xrange(len(JOINT_NAMES)):
+            angles[JOINT_NAMES[j]].extend(values[:, j, 0].tolist())
+    return angles
 
 
 def dump_gesture_data(behaviors, name):
@@ -95,71 +96,41 @@ def dump_gesture_data(behaviors, name):
     dump(process(behaviors), open('pickles/gesture_data/' + name, 'wb'))
 
 
-def time_series(behav, save_directory='plots/time_series/standing_bodytalk', return_data=False):
+def time_series(behav, save_directory='plots/time_series/standing_bodytalk', return_data=False,
+                threshold=0.2, rate=None, method='linear', sample_rate=50.0):
     '''
     Generates time series plots for all 26 of NAO's joints
     while they perform a specified behavior.
 
     :param behav: Behavior to be performed.
     :param save_directory: Directory to save plots in.
+    :param threshold: Minimum spacing in seconds between kept samples.
+    :param rate: If given, resample to this many frames per second
+                 instead of thresholding.
+    :param method: Interpolation for fixed-rate frames, 'nearest' or 'linear'.
+    :param sample_rate: Rate in samples per second at which joints are read.
     '''
-
-    def get_angles(data):
-        '''
-        Given a dataset, only find the radian angle
-        corresponding to NAO's sensor movements.
-
-        :param data: Data to sift through for get_angles.
-        :return: An array of angles in float format.
-        '''
-        angles = []
-        for i in xrange(len(data)):
-            split = data[i].split('\n')[2:]  # Remove first 2 header rows.
-            cutoff = 0  # Find where to split the file.
-            for j in range(len(split)):
-                if 'Tasks' in split[j]:
-                    cutoff = j
-                    break
-            angles.append([t[2] for t in [l.split() for l in split[:cutoff]]])
-        return [[float(n) for n in report] for report in angles]
-
-    # Allocate arrays for data collection.
-    # Entries are time-sequential by index.
-    data = []
-    times = []
-
     behavior_proxy.runBehavior(behav)
 
     # Begin data collection as behavior runs.
-    t = time()
+    # Timestamps are seconds since the sampler started.
+    sampler = JointSampler(motion_proxy, rate=sample_rate, fields=('command',))
+    sampler.start()
     behavior_proxy.post.runBehavior(behav)
     sleep(0.125)  # Account for latency.
-    while behavior_proxy.isBehaviorRunning(behav):
-        data.append(motion_proxy.getSummary())
-        times.append(time() - t)
-
-    # O(n) algorithm to filter by threshold-time intervals.
-    keep = [0]
-    threshold = 0.2
-    begin = 0
-    end = 0
-    while end < len(times):
-        if times[end] - times[begin] >= threshold:
-            keep.append(end)
-            begin = end
-        else:
-            end += 1
-
-    # Postprocess the data.
-    angles = get_angles(data)
-    for n in reversed([t for t in range(len(times)) if t not in keep]):
-        times.pop(n)
-        angles.pop(n)
+    times, values = record(sampler, lambda: behavior_proxy.isBehaviorRunning(behav))
+
+    # Space the frames by threshold, or by a fixed rate if one is given.
+    if rate:
+        threshold = 1.0 / rate
+        times, angles = resample(times, values[:, :, 0], rate=rate, method=method)
+    else:
+        times, angles = resample(times, values[:, :, 0], threshold=threshold)
 
     print '\nNumber of data points:', len(angles), '\n'
 
     if return_data:
-        return threshold, angles
+        return threshold, angles.tolist()
 
     # Name of gesture without directory prefixes.
     gesture = behav.split('/')[-1]
@@ -170,7 +141,7 @@ def time_series(behav, save_directory='plots/time_series/standing_bodytalk', ret
     cm = plt.get_cmap('jet')
     ax.set_color_cycle([cm(1. * i / num_colors) for i in range(num_colors)])
     for i in xrange(num_colors):
-        ax.plot(times, [joint[i] for joint in angles], label=JOINT_NAMES[i], linewidth=0.7,
+        ax.plot(times, angles[:, i], label=JOINT_NAMES[i], linewidth=0.7,
                 path_effects=[path_effects.SimpleLineShadow(offset=(0.5, -0.5)), path_effects.Normal()])
 
     # Decorate the graph and save figure to .pdf format.
@@ -0,0 +1,170 @@
+'''
+Kernel density plots of joint sensor readings.
+
+The densities of every joint are estimated together: samples
+are linearly binned onto one shared normalized grid and
+convolved with each joint's Gaussian kernel through a single
+FFT, with Scott's rule bandwidths as seaborn uses. Figures are
+drawn with the Agg canvas, so no display is needed, and
+rendered across a pool of processes.
+
+To plot every gesture category, e.g. to plots/no_plots:
+
+    python distribution_plots.py pickles/gesture_data/ plots/ [--rug]
+'''
+import os
+import sys
+import numpy as np
+import multiprocessing
+from gesture_dataset import load_data
+
+FIGURE_SIZE = (5.5, 3.8)  # Best for viewing.
+
+
+def scott_bandwidth(samples):
+    '''
+    :return: Scott's rule kernel bandwidth for 1-D samples.
+    '''
+    return np.std(samples, ddof=1) * len(samples) ** -0.2 if len(samples) > 1 else 0.0
+
+
+def joint_densities(data, joints=None, grid_size=512, cut=3):
+    '''
+    Estimates the density of every joint at once. All joints
+    share one normalized grid of grid_size points, mapped onto
+    each joint's support (its samples extended by cut
+    bandwidths, as in seaborn).
+
+    :param data: Mapping of joint names to arrays of samples.
+    :param joints: Joints to estimate, default of every key of data.
+    :param grid_size: Points on the grid.
+    :param cut: Kernel bandwidths the support extends past the
+                extreme samples.
+    :return: Tuple (joints, grids, densities) where grids and
+             densities are (joints, grid_size) arrays.
+    '''
+    joints = list(data.keys()) if joints is None else list(joints)
+    columns = [np.asarray(data[j], dtype=np.float64) for j in joints]
+    counts = np.array([len(c) for c in columns])
+    bandwidth = np.array([scott_bandwidth(c) for c in columns])
+    low = np.array([c.min() for c in columns])
+    high = np.array([c.max() for c in columns])
+    # Constant joints get a narrow kernel of their own.
+    bandwidth[bandwidth == 0] = 1e-3
+    start = low - cut * bandwidth
+    step = (high + cut * bandwidth - start) / (grid_size - 1)
+    grids = start[:, None] + step[:, None] * np.arange(grid_size)
+
+    # Linear binning of every joint at once.
+    owner = np.repeat(np.arange(len(joints)), counts)
+    position = (np.concatenate(columns) - start[owner]) / step[owner]
+    left = np.clip(position.astype(int), 0, grid_size - 2)
+    weight = position - left
+    index = owner * grid_size + left
+    binned = np.bincount(index, 1 - weight, len(joints) * grid_size) + \
+        np.bincount(index + 1, weight, len(joints) * grid_size)
+    binned = binned.reshape(len(joints), grid_size)
+
+    # Gaussian smoothing by FFT, zero-padded against wrap-around;
+    # bandwidths are in grid steps of their joint.
+    size = 1 << int(np.ceil(np.log2(2 * grid_size)))
+    frequencies = np.fft.rfftfreq(size)
+    kernels = np.exp(-2 * (np.pi * frequencies[None, :] * (bandwidth / step)[:, None]) ** 2)
+    smoothed = np.fft.irfft(np.fft.rfft(binned, size, axis=1) * kernels, size, axis=1)[:, :grid_size]
+    densities = np.maximum(smoothed, 0) / (counts * step)[:, None]
+    return joints, grids, densities
+
+
+def render(job):
+    '''
+    Draws and saves one joint's density plot.
+
+    :param job: Tuple (joint, x, density, filename, data path or
+                None); the data path is given to draw a rug.
+    '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    joint, x, density, filename, rug = job
+    figure = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    line, = axes.plot(x, density)
+    if rug:
+        samples = np.asarray(load_data(rug)[joint])
+        axes.plot(samples, np.zeros_like(samples), '|', color=line.get_color(),
+                  markersize=10, alpha=0.5)
+    axes.set_title(joint + ' Sensor Distribution', fontdict={'fontsize': 14}, style='italic')
+    axes.set_xlabel("Angle (rad)")
+    axes.set_ylabel("Frequency")
+    figure.savefig(filename, bbox_inches='tight')
+    return filename
+
+
+def distribution_jobs(path, save_directory, rug=False, grid_size=512):
+    '''
+    :param path: Gesture data file of one category.
+    :param save_directory: Directory to save its plots in.
+    :param rug: Whether to draw a rug of the samples.
+    :return: List of render jobs, one per joint.
+    '''
+    if not os.path.isdir(save_directory):
+        os.makedirs(save_directory)
+    joints, grids, densities = joint_densities(load_data(path), grid_size=grid_size)
+    return [(j, grids[i], densities[i], os.path.join(save_directory, j + '.pdf'),
+             path if rug else None)
+            for i, j in enumerate(joints)]
+
+
+def run_jobs(jobs, processes=None):
+    '''
+    Renders jobs across a pool of processes; processes=1
+    renders them in this process.
+
+    :return: List of the files written.
+    '''
+    processes = min(processes or multiprocessing.cpu_count(), len(jobs))
+    if processes <= 1:
+        return [render(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(render, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def plot_distributions(path, save_directory, rug=False, processes=None):
+    '''
+    Plots the density of every joint of one category.
+
+    :param path: Gesture data file.
+    :param save_directory: Directory to save the plots in.
+    :param rug: Whether to draw a rug of the samples.
+    :param processes: Rendering processes, default of one per core.
+    :return: List of the files written.
+    '''
+    return run_jobs(distribution_jobs(path, save_directory, rug), processes)
+
+
+def plot_categories(directory='pickles/gesture_data/', plots='plots/', rug=False, processes=None):
+    '''
+    Plots every category of a gesture data directory, all
+    of their figures rendered by one pool.
+
+    :param directory: Directory of gesture data files.
+    :param plots: Directory to save <category>_plots directories in.
+    :param rug: Whether to draw a rug of the samples.
+    :param processes: Rendering processes, default of one per core.
+    :return: List of the files written.
+    '''
+    jobs = []
+    for category in sorted(os.listdir(directory)):
+        jobs += distribution_jobs(os.path.join(directory, category),
+                                  os.path.join(plots, category + '_plots'), rug)
+    return run_jobs(jobs, processes)
+
+
+if __name__ == '__main__':
+    arguments = [a for a in sys.argv[1:] if a != '--rug']
+    written = plot_categories(*arguments, rug='--rug' in sys.argv)
+    print 'Saved', len(written), 'plots.'
@@ -0,0 +1,99 @@
+'''
+A bounded least-recently-used cache of text embeddings.
+
+Embedding text with spaCy runs its whole pipeline, while
+the same phrases keep coming back (operators repeat
+themselves, corpora are re-embedded on every training).
+The cache keeps the vectors of recent texts, keyed by
+their normalized form, within an entry and memory limit.
+'''
+from collections import OrderedDict
+
+
+def normalize(text):
+    '''
+    :return: text with surrounding and repeated whitespace removed.
+    '''
+    return ' '.join(text.split())
+
+
+class EmbeddingCache():
+    """
+    Maps text to its embedding, computing vectors on a miss
+    and evicting the least recently used ones when full.
+    Cached vectors are read-only.
+    """
+
+    def __init__(self, embed, max_entries=10000, max_bytes=None):
+        """
+        :param embed: Function from normalized text to a NumPy vector.
+        :param max_entries: Most vectors to keep.
+        :param max_bytes: Most bytes of vectors and keys to keep, or None.
+        """
+        self.embed = embed
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, text):
+        return normalize(text) in self.entries
+
+    def get(self, text):
+        """
+        :param text: Text to embed.
+        :return: The text's vector, from the cache if possible.
+        """
+        key = normalize(text)
+        if key in self.entries:
+            self.hits += 1
+            # Move to the most recently used end.
+            vector = self.entries.pop(key)
+            self.entries[key] = vector
+            return vector
+        self.misses += 1
+        return self.put(key, self.embed(key))
+
+    def put(self, text, vector):
+        """
+        Stores a vector computed elsewhere.
+
+        :param text: Text the vector belongs to.
+        :param vector: NumPy vector of the text.
+        :return: The stored, read-only vector.
+        """
+        key = normalize(text)
+        if key in self.entries:
+            self.bytes -= self.size(key, self.entries.pop(key))
+        vector.flags.writeable = False
+        self.entries[key] = vector
+        self.bytes += self.size(key, vector)
+        while len(self.entries) > self.max_entries or \
+                (self.max_bytes is not None and self.bytes > self.max_bytes and len(self.entries) > 1):
+            old_key, old_vector = self.entries.popitem(last=False)
+            self.bytes -= self.size(old_key, old_vector)
+            self.evictions += 1
+        return vector
+
+    def size(self, key, vector):
+        return vector.nbytes + len(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """
+        :return: Dictionary of entries, bytes, hits, misses,
+                 evictions and hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0}
@@ -0,0 +1,177 @@
+'''
+Columnar on-disk format for gesture data.
+
+A gesture file holds one float array per joint. It starts
+with a small JSON header that carries the joint names, the
+position of every column and precomputed per-joint means and
+standard deviations, so the statistics can be read without
+touching the samples. Columns are memory-mapped on demand.
+
+Layout: MAGIC, header length (uint32, little-endian), JSON
+header padded to ALIGN bytes, then little-endian float64
+columns back to back.
+
+To convert the pickled dictionaries under pickles/gesture_data:
+
+    python gesture_dataset.py pickles/gesture_data pickles/gesture_columns
+'''
+import os
+import sys
+import json
+import struct
+import numpy as np
+from pickle import load
+
+MAGIC = b'NAOGEST1'
+VERSION = 1
+ALIGN = 64
+DTYPE = '<f8'
+
+
+def is_dataset(path):
+    '''
+    :param path: Path to a gesture file.
+    :return: True if the file is in the columnar format.
+    '''
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path):
+    '''
+    Reads only the header of a columnar gesture file.
+
+    :param path: Path to the file.
+    :return: The header dictionary, with the byte offset
+             of the first column added as data_offset.
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a columnar gesture file.')
+        length = struct.unpack('<I', f.read(4))[0]
+        header = json.loads(f.read(length).decode('utf-8'))
+    header['data_offset'] = len(MAGIC) + 4 + length
+    if header['version'] != VERSION:
+        raise ValueError('Unsupported gesture file version: ' + str(header['version']))
+    return header
+
+
+def write_dataset(data, path):
+    '''
+    Writes gesture data in the columnar format.
+
+    :param data: Dictionary of joint names to lists of samples.
+    :param path: Path of the file to write.
+    '''
+    joints = sorted(data)
+    columns = [np.asarray(data[j], dtype=DTYPE) for j in joints]
+    offsets = np.cumsum([0] + [c.nbytes for c in columns[:-1]]).tolist()
+    header = {'version': VERSION, 'dtype': DTYPE, 'joints': joints,
+              'counts': [len(c) for c in columns], 'offsets': offsets,
+              'mean': [float(c.mean()) if len(c) else 0.0 for c in columns],
+              'std': [float(c.std()) if len(c) else 0.0 for c in columns]}
+    text = json.dumps(header).encode('utf-8')
+    # Pad the header so the columns start on an aligned offset.
+    start = len(MAGIC) + 4 + len(text)
+    text += b' ' * (-start % ALIGN)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(text)))
+        f.write(text)
+        for c in columns:
+            f.write(c.tobytes())
+
+
+class GestureDataset():
+    """
+    A columnar gesture file. Statistics come from the header;
+    samples are memory-mapped only when a column is asked for.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to a columnar gesture file.
+        """
+        self.path = path
+        self.header = read_header(path)
+        self.joint_names = [str(j) for j in self.header['joints']]
+        self.joint_index = {j: i for i, j in enumerate(self.joint_names)}
+        self.means = np.array(self.header['mean'])
+        self.stds = np.array(self.header['std'])
+        self.mapped = None
+
+    def keys(self):
+        return list(self.joint_names)
+
+    def __contains__(self, joint):
+        return joint in self.joint_index
+
+    def __getitem__(self, joint):
+        """
+        :param joint: Joint name.
+        :return: Read-only memory-mapped array of the joint's samples.
+        """
+        if self.mapped is None:
+            self.mapped = np.memmap(self.path, dtype=np.uint8, mode='r')
+        i = self.joint_index[joint]
+        begin = self.header['data_offset'] + self.header['offsets'][i]
+        end = begin + self.header['counts'][i] * np.dtype(DTYPE).itemsize
+        return self.mapped[begin:end].view(DTYPE)
+
+
+def load_data(path):
+    '''
+    Loads gesture data in either format.
+
+    :param path: Path to a columnar file or a pickled dictionary.
+    :return: A mapping of joint names to arrays of samples.
+    '''
+    if is_dataset(path):
+        return GestureDataset(path)
+    return load(open(path, 'rb'))
+
+
+def load_statistics(path):
+    '''
+    Loads per-joint statistics of gesture data in either format,
+    reading only the header of columnar files.
+
+    :param path: Path to a columnar file or a pickled dictionary.
+    :return: Tuple (joint_names, means, stds), means and stds
+             being arrays ordered like joint_names.
+    '''
+    if is_dataset(path):
+        dataset = GestureDataset(path)
+        return dataset.joint_names, dataset.means, dataset.stds
+    data = load(open(path, 'rb'))
+    joints = sorted(data)
+    return (joints, np.array([np.mean(data[j]) for j in joints]),
+            np.array([np.std(data[j]) for j in joints]))
+
+
+def convert_pickle(source, destination):
+    '''
+    Converts one pickled gesture dictionary to the columnar format.
+
+    :param source: Path of the pickle.
+    :param destination: Path of the file to write.
+    '''
+    write_dataset(load(open(source, 'rb')), destination)
+
+
+def convert_directory(source, destination):
+    '''
+    Converts every pickled gesture dictionary in a directory,
+    keeping file names.
+
+    :param source: Directory of pickles.
+    :param destination: Directory to write columnar files to.
+    '''
+    if not os.path.isdir(destination):
+        os.makedirs(destination)
+    for filename in sorted(os.listdir(source)):
+        convert_pickle(os.path.join(source, filename), os.path.join(destination, filename))
+
+
+if __name__ == '__main__':
+    convert_directory(sys.argv[1], sys.argv[2])
@@ -1,5 +1,8 @@
+import threading
 from os import listdir
-from pickle import load
+from time import time
+from collections import deque
+from nao_proxy import proxy
 from motion_analyzer import NAOMotionDataAnalyzer as MotionAnalyzer
 
 
@@ -13,7 +16,7 @@ class GestureModule():
     of time.
     """
 
-    def __init__(self, analyzer, time=0.6):
+    def __init__(self, analyzer, time=0.6, keyframes=False):
         """
         Creates an instance of the gesture module.
 
@@ -21,11 +24,18 @@ class GestureModule():
                          instance containing the data
                          and statistics for the gesture type.
         @param time: How long each generated movement should last.
+        @param keyframes: Whether to send all movements of a
+                          gesture as one multi-keyframe trajectory
+                          instead of one call per movement.
         """
         self.analyzer = analyzer
         self.time = time
+        self.keyframes = keyframes
 
     def move(self, total_time):
+        if self.keyframes:
+            self.analyzer.move_trajectory(total_time, self.time)
+            return
         for i in range(int(total_time / self.time)):
             self.analyzer.move(self.time)
 
@@ -33,53 +43,257 @@ class GestureModule():
         self.analyzer.reestablish_connection()
 
 
+class GestureScheduler():
+    """
+    Runs gesture segments on NAO back to back.
+
+    A worker thread submits each segment with the
+    non-blocking post mechanism and, while NAO executes
+    it, already generates the next one, so that the
+    next segment is ready the moment the current ends.
+    """
+
+    def __init__(self, motion_proxy):
+        """
+        @param motion_proxy: Proxy to ALMotion shared
+                             by the modules scheduled.
+        """
+        self.motion_proxy = motion_proxy
+        self.pending = deque()
+        self.condition = threading.Condition()
+        # Bumped by cancel() to discard segments already taken.
+        self.generation = 0
+        self.task = None
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        # Last exception of a failed segment, raised by wait().
+        self.error = None
+        self.worker = threading.Thread(target=self.run)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, module, total_time):
+        """
+        Queues a gesture module's segments for the given time.
+
+        @param module: The GestureModule to move with.
+        @param total_time: How long the gesture should last.
+        """
+        segments = int(total_time / module.time)
+        if module.keyframes:
+            # The whole gesture goes out as one trajectory.
+            tasks = [(module, total_time)] if segments else []
+        else:
+            tasks = [(module, module.time)] * segments
+        with self.condition:
+            self.pending.extend(tasks)
+            self.submitted += len(tasks)
+            self.condition.notify_all()
+
+    def fail(self, error):
+        # Counts a segment that raised as cancelled, keeping the error.
+        with self.condition:
+            self.error = error
+            self.cancelled += 1
+            self.condition.notify_all()
+
+    def prepare(self, block):
+        # Takes the next module off the queue and generates its segment.
+        while True:
+            with self.condition:
+                while block and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    return None
+                module, duration = self.pending.popleft()
+                generation = self.generation
+            try:
+                if module.keyframes:
+                    joints, angles, times = module.analyzer.trajectory(duration, module.time)
+                else:
+                    joints, angles = module.analyzer.segment()
+                    times = module.time
+                return generation, joints, angles, times
+            except Exception as e:
+                self.fail(e)
+
+    def run(self):
+        prepared = None
+        while True:
+            if prepared is None:
+                prepared = self.prepare(True)
+            generation, joints, angles, times = prepared
+            prepared = None
+            with self.condition:
+                if generation != self.generation:
+                    self.cancelled += 1
+                    self.condition.notify_all()
+                    continue
+                try:
+                    self.task = self.motion_proxy.post.angleInterpolation(
+                        joints, angles, times, True)
+                except Exception as e:
+                    self.fail(e)
+                    continue
+                task = self.task
+            # Generate the next segment while NAO executes this one.
+            prepared = self.prepare(False)
+            try:
+                self.motion_proxy.wait(task, 0)
+            except Exception as e:
+                with self.condition:
+                    self.task = None
+                self.fail(e)
+                continue
+            with self.condition:
+                self.task = None
+                self.completed += 1
+                self.condition.notify_all()
+
+    def cancel(self):
+        """
+        Drops every queued segment and stops the one running.
+        """
+        with self.condition:
+            self.cancelled += len(self.pending)
+            self.pending.clear()
+            self.generation += 1
+            if self.task is not None:
+                self.motion_proxy.stop(self.task)
+            self.condition.notify_all()
+
+    def done(self):
+        """
+        @return: Whether every submitted segment has
+                 finished or been cancelled.
+        """
+        with self.condition:
+            return self.completed + self.cancelled >= self.submitted
+
+    def wait(self, timeout=None):
+        """
+        Blocks until every submitted segment has finished
+        or been cancelled. If a segment failed meanwhile,
+        its exception is raised (once) instead.
+
+        @param timeout: Seconds to wait at most, or None.
+        @return: Whether the queue was fully processed.
+        """
+        deadline = None if timeout is None else time() + timeout
+        with self.condition:
+            while self.completed + self.cancelled < self.submitted:
+                if deadline is None:
+                    self.condition.wait()
+                elif deadline <= time():
+                    break
+                else:
+                    self.condition.wait(deadline - time())
+            error, self.error = self.error, None
+            if error is not None:
+                raise error
+            return self.completed + self.cancelled >= self.submitted
+
+
 class GestureSuite():
     """
     A suite for all of NAO's generated
-    gesture modules. Loads in all modules
-    it can find under the directory provided.
+    gesture modules. Finds all modules under
+    the directory provided, loading each one
+    the first time its category is requested.
+    All modules share one connection to NAO.
 
     Operates jointly with speech modules that pass
     in a queue of types of gestures to perform with
     their animation times.
     """
 
-    def __init__(self, directory='pickles/gesture_data/'):
+    def __init__(self, directory='pickles/gesture_data/', robot_ip='127.0.0.1', keyframes=False):
         """
         Initializes the class.
-        Wakes up all the modules loaded to
-        ensure connection with NAO.
+        Wakes up NAO once over the shared
+        connection to ensure it is ready.
 
         @param directory: Relative path to search in
                           for modules. Defaulted to
                           'pickles/gesture_data/'.
+        @param robot_ip: NAO's IP, in string format.
+        @param keyframes: Whether modules send each gesture as
+                          one multi-keyframe trajectory.
         """
+        self.ip = robot_ip
+        self.keyframes = keyframes
+        self.port = 9559
+        # Categories map to their data files; modules are built on demand.
+        self.paths = {filename: directory + filename for filename in listdir(directory)}
         self.modules = {}
-        for filename in listdir(directory):
-            try:
-                module = GestureModule(MotionAnalyzer(directory + filename))
-                self.modules[filename] = module
-            except:
-                print 'Invalid file. Check your directory again.'
-                return
         # Print a warning if no modules were found.
-        if not self.modules:
+        if not self.paths:
             print 'WARNING: You either have no modules or the directory is empty.'
-        for module in self.modules.values():
-            module.wake_up()
+        self.motion_proxy = proxy('ALMotion', self.ip, self.port)
+        self.awareness = proxy('ALBasicAwareness', self.ip, self.port)
+        self.awareness.stopAwareness()
+        self.motion_proxy.wakeUp()
+        self.scheduler = GestureScheduler(self.motion_proxy)
 
-    def move(self, queue):
+    def module(self, category):
+        """
+        Returns the module for a category,
+        loading its statistics on first use.
+
+        @param category: Name of the gesture category.
+        @return: The GestureModule, or None if the category
+                 does not exist or its file is invalid.
+        """
+        if category not in self.modules:
+            if category not in self.paths:
+                return None
+            try:
+                analyzer = MotionAnalyzer(self.paths[category], self.ip, wake_up=False)
+            except:
+                print 'Invalid file ' + self.paths[category] + '. Check your directory again.'
+                del self.paths[category]
+                return None
+            self.modules[category] = GestureModule(analyzer, keyframes=self.keyframes)
+        return self.modules[category]
+
+    def wake_up(self):
+        """
+        Reconnects the shared connection and wakes NAO up.
+        """
+        self.motion_proxy.reconnect()
+        self.motion_proxy.wakeUp()
+
+    def move(self, queue, block=True):
         """
         Moves NAO sequentially (hence the queue)
         according to category and time provided.
+        Segments are pipelined by the suite's scheduler,
+        so there is no pause between them.
 
         @param queue: Queue of motions to direct NAO.
                       Must be a list of tuples [t_0, ..., t_n],
                       where t_i = (String category_i,
                                    float time_of_animation_i).
+        @param block: Whether to wait until the queue is done.
+                      If False, returns at once; use the
+                      scheduler to track or cancel the queue.
+                      Raises the error of a failed segment
+                      when waiting.
+        @return: The suite's GestureScheduler.
         """
         for pair in queue:
             category = pair[0]
             period = pair[1]
-            if category in self.modules:
-                self.modules[category].move(period)
+            module = self.module(category)
+            if module is not None:
+                self.scheduler.submit(module, period)
+        if block:
+            self.scheduler.wait()
+        return self.scheduler
+
+    def cancel(self):
+        """
+        Stops the current movement and drops the rest of the queue.
+        """
+        self.scheduler.cancel()
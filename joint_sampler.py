@@ -0,0 +1,149 @@
+'''
+Fixed-rate background sampling of NAO's joints.
+
+Instead of polling getSummary() as fast as the link allows,
+a JointSampler thread reads only the joint values it was
+asked for at a steady rate, and writes them into a
+preallocated ring buffer with monotonic timestamps. Callers
+drain the buffer whenever they like, including while the
+robot is still moving.
+'''
+import threading
+import numpy as np
+from time import sleep
+from nao_joints import JOINT_NAMES
+from report_parser import FIELDS
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 has no monotonic clock in the standard library.
+    from time import time as monotonic
+
+
+def read_fields(motion_proxy, joint_names, fields):
+    '''
+    Reads the requested fields of the given joints.
+
+    :param motion_proxy: Proxy to ALMotion.
+    :param joint_names: Joints to read.
+    :param fields: Names out of report_parser.FIELDS.
+    :return: A list with one list of values per field.
+    '''
+    readers = {'stiffness': lambda: motion_proxy.getStiffnesses(joint_names),
+               'command': lambda: motion_proxy.getAngles(joint_names, False),
+               'sensor': lambda: motion_proxy.getAngles(joint_names, True)}
+    return [readers[f]() for f in fields]
+
+
+class JointSampler(threading.Thread):
+    """
+    A daemon thread sampling joint values at a fixed rate into
+    a ring buffer of shape (capacity, joints, fields). When the
+    buffer is full, the oldest undrained samples are overwritten
+    and counted as dropped. If a read fails, sampling stops and
+    the error is raised from drain().
+    """
+
+    def __init__(self, motion_proxy, joint_names=JOINT_NAMES, rate=50.0,
+                 capacity=4096, fields=('sensor',)):
+        """
+        :param motion_proxy: Proxy to ALMotion.
+        :param joint_names: Joints to sample, in buffer order.
+        :param rate: Samples per second.
+        :param capacity: Number of samples the ring buffer holds.
+        :param fields: Which of report_parser.FIELDS to read per joint.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        for f in fields:
+            if f not in FIELDS:
+                raise ValueError('Unknown field: ' + str(f))
+        self.motion_proxy = motion_proxy
+        self.joint_names = list(joint_names)
+        self.fields = tuple(fields)
+        self.period = 1.0 / rate
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, len(self.joint_names), len(self.fields)))
+        self.written = 0
+        self.read = 0
+        self.dropped = 0
+        self.start_time = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.start_time = monotonic()
+        threading.Thread.start(self)
+
+    def run(self):
+        tick = monotonic()
+        while not self.stopped.is_set():
+            stamp = monotonic() - self.start_time
+            try:
+                sample = read_fields(self.motion_proxy, self.joint_names, self.fields)
+            except Exception as e:
+                # Dropped link or RPC error: stop, and report it on drain.
+                self.error = e
+                self.stopped.set()
+                return
+            with self.lock:
+                slot = self.written % self.capacity
+                self.times[slot] = stamp
+                self.values[slot] = np.transpose(sample)
+                self.written += 1
+            tick += self.period
+            delay = tick - monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                # Fell behind (slow link); skip the missed ticks.
+                tick = monotonic()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the thread to finish.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def drain(self):
+        """
+        Takes every sample written since the last drain.
+
+        :return: Tuple (times, values), times in seconds since
+                 the sampler started and values of shape
+                 (samples, joints, fields), oldest first.
+        """
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            if self.written - self.read > self.capacity:
+                self.dropped += self.written - self.read - self.capacity
+                self.read = self.written - self.capacity
+            slots = np.arange(self.read, self.written) % self.capacity
+            self.read = self.written
+            return self.times[slots], self.values[slots]
+
+
+def record(sampler, running, poll=0.1):
+    '''
+    Drains a started sampler for as long as running() holds,
+    then stops it. Raises the sampler's error if a read failed.
+
+    :param sampler: A started JointSampler.
+    :param running: Function returning whether to keep recording.
+    :param poll: Seconds between checks of running().
+    :return: Tuple (times, values) of everything recorded.
+    '''
+    chunks = []
+    while running():
+        sleep(poll)
+        chunks.append(sampler.drain())
+    sampler.stop()
+    chunks.append(sampler.drain())
+    return (np.concatenate([c[0] for c in chunks]),
+            np.concatenate([c[1] for c in chunks]))
@@ -7,37 +7,73 @@ environment compatibility issues between spaCy and naoqi.
 
 import en_vectors_glove_md as spacy_model
 from pickle import load
-from numpy import array
+from numpy import array, dot
+from numpy.linalg import norm
 from subprocess import call  # Use later to call gesture_suite.py.
 from sklearn.linear_model import SGDClassifier
+from embedding_cache import EmbeddingCache
+from vector_index import VectorIndex
+from online_learning import OnlineTrainer, load_checkpoint, CHECKPOINT
 
 
 class LanguageProcessing():
 
-    def __init__(self, model=None):
+    def __init__(self, model=None, cache_entries=10000, cache_bytes=None, index=None,
+                 checkpoint=CHECKPOINT, batch_size=16):
+        """
+        :param model: A trained classifier to use instead of
+                      training one on the speech corpus. Its
+                      labels index the corpus' categories, and
+                      it is trained online like the corpus one.
+        :param cache_entries: Most text embeddings to keep cached.
+        :param cache_bytes: Most bytes of embeddings to keep cached, or None.
+        :param index: Directory of a saved VectorIndex over the
+                      vocabulary, for similar-word queries.
+        :param checkpoint: File online training is checkpointed to
+                           and resumed from, or None to not keep one.
+        :param batch_size: Confirmed queries per online update.
+        """
+        self.index = VectorIndex.load(index) if index else None
         # Machine learning models.
         self.nlp = spacy_model.load()
-        if model:
-            self.model = model
+        self.embeddings = EmbeddingCache(lambda text: self.return_nlp(text).vector,
+                                         cache_entries, cache_bytes)
+        saved = load_checkpoint(checkpoint) if checkpoint and not model else None
+        if saved:
+            # Resume from the last online training session.
+            self.model = saved['model']
+            self.corpus = saved['corpus']
+            self.categories = saved['categories']
         else:
-            self.model = SGDClassifier()
-            # Preprocessing the corpus.
+            self.model = model or SGDClassifier()
+            # Preprocessing the corpus; a given model's labels
+            # index its categories too.
             # self.corpus: Map<String, List<String>>
             self.corpus = load(open('pickles/speech_corpus', 'rb'))
             self.categories = self.corpus.keys()
-            self.classifications_by_cat = {self.categories[i]: i
-                                           for i in range(len(self.categories))}
-            self.classifications_by_num = {i: self.categories[i]
-                                           for i in range(len(self.categories))}
+        self.classifications_by_cat = {self.categories[i]: i
+                                       for i in range(len(self.categories))}
+        self.classifications_by_num = {i: self.categories[i]
+                                       for i in range(len(self.categories))}
+        if not saved and not model:
             # Training the model.
             training_x = []
             training_y = []
             for k in self.corpus:
                 sentences = self.corpus[k]
-                training_x += [self.return_nlp(s).vector for s in sentences]
+                training_x += [self.vector(s) for s in sentences]
                 training_y += [self.classifications_by_cat[k]
                                for i in range(len(sentences))]
             self.model.fit(array(training_x), array(training_y))
+        self.trainer = OnlineTrainer(self.model, self.corpus, self.categories,
+                                     batch_size, checkpoint=checkpoint,
+                                     on_update=self.set_model)
+
+    def set_model(self, model):
+        """
+        Swaps in a model updated by online training.
+        """
+        self.model = model
 
     def return_nlp(self, text):
         """
@@ -46,16 +82,44 @@ class LanguageProcessing():
         """
         return self.nlp(unicode(text))
 
+    def vector(self, text):
+        """
+        Returns the GloVe vector of text, from
+        the embedding cache when it was seen before.
+        """
+        return self.embeddings.get(text)
+
     def string_similarity(self, s1, s2):
         """
         Using spaCy, computes the similarity
         between two strings based on the
         GloVe vectors provided.
         """
-        return self.return_nlp(s1).similarity(self.return_nlp(s2))
+        v1 = self.vector(s1)
+        v2 = self.vector(s2)
+        # Cosine similarity, as spaCy computes it.
+        norms = norm(v1) * norm(v2)
+        return float(dot(v1, v2) / norms) if norms else 0.0
+
+    def similar_words(self, text, k=10, threshold=None):
+        """
+        Finds the vocabulary words closest to text
+        using the vector index.
+
+        :param k: How many words to return.
+        :param threshold: If given, return every word at least
+                          this similar instead of the top k.
+        :return: List of (word, similarity), most similar first.
+        """
+        if self.index is None:
+            raise ValueError('similar_words needs a vector index; pass the directory '
+                             'of one built by vector_index.py as index.')
+        if threshold is not None:
+            return self.index.radius(self.vector(text), threshold)
+        return self.index.top_k(self.vector(text), k)
 
     def train_with_query(self, query):
-        query_vectorized = [self.return_nlp(query).vector]
+        query_vectorized = [self.vector(query)]
         pred = self.model.predict(
             array(query_vectorized))[0]
         # Inform the user of the prediction and
@@ -66,8 +130,16 @@ class LanguageProcessing():
         decision = raw_input(
             'Is this what you expected? 0 for N, 1 for Y.\n> ')
         print '\n' * 2
-        if eval(decision) == 1:
-            # Update the corpus and train the model.
-            self.corpus[self.classifications_by_num[pred]].append(query)
-            self.model.partial_fit(array(query_vectorized), array([pred]))
+        if decision.strip() == '1':
+            # Update the corpus and train the model in the background;
+            # raises if an earlier update failed.
+            self.trainer.add(query, query_vectorized[0], pred)
         return query, self.classifications_by_num[pred]
+
+    def close(self):
+        """
+        Trains on and checkpoints every confirmed query
+        still waiting, then stops online training. Raises
+        the error of an update that failed.
+        """
+        self.trainer.close()
@@ -1,69 +1,333 @@
+import os
+import json
+import pickle
 import numpy as np
+import multiprocessing
 import sklearn.linear_model as linear
 import sklearn.naive_bayes as bayes
 import sklearn.neural_network as neural
-import matplotlib.pyplot as plt
+from timeit import default_timer as clock
+from multiprocessing.sharedctypes import RawArray
+from sklearn.base import clone
 from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score
 
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
 
-def k_fold_cv(k, data, classifier=SVC()):
+# Samples, label codes and folds of the cross-validation in
+# progress, attached once per worker process.
+_shared = {}
+
+
+def _share(array, typecode):
+    # Copies an array into shared memory that worker processes
+    # inherit instead of receiving a pickled copy per job.
+    raw = RawArray(typecode, int(array.size))
+    np.frombuffer(raw, dtype=array.dtype)[:] = array.ravel()
+    return raw
+
+
+def _attach(x, x_dtype, x_shape, y, folds):
+    _shared['x'] = np.frombuffer(x, dtype=x_dtype).reshape(x_shape)
+    _shared['y'] = np.frombuffer(y, dtype=np.int32)
+    _shared['folds'] = folds
+
+
+def _run_fold(job):
+    name, classifier, i = job
+    x, y, folds = _shared['x'], _shared['y'], _shared['folds']
+    train = np.concatenate(folds[:i] + folds[i + 1:])
+    test = folds[i]
+    classifier.fit(x[train], y[train])
+    return name, i, accuracy_score(y[test], classifier.predict(x[test]))
+
+
+def _peak_memory():
+    # Peak resident memory of this process in megabytes.
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, bytes on macOS.
+    return peak / (1024.0 * 1024.0) if os.uname()[0] == 'Darwin' else peak / 1024.0
+
+
+def _benchmark_fold(job):
+    name, classifier, i, rows = job
+    x, y, folds = _shared['x'], _shared['y'], _shared['folds']
+    train = np.concatenate(folds[:i] + folds[i + 1:])
+    test = folds[i]
+    memory = _peak_memory()
+    start = clock()
+    classifier.fit(x[train], y[train])
+    fit = clock() - start
+    single = []
+    for r in test[:rows]:
+        start = clock()
+        classifier.predict(x[r:r + 1])
+        single.append(clock() - start)
+    start = clock()
+    predictions = classifier.predict(x[test])
+    batch = clock() - start
+    single = np.array(single) * 1000
+    return name, {'fit_s': fit,
+                  'single_p50_ms': float(np.percentile(single, 50)),
+                  'single_p95_ms': float(np.percentile(single, 95)),
+                  'batch_ms': batch * 1000, 'batch_rows': len(test),
+                  'batch_per_row_ms': batch * 1000 / len(test),
+                  'peak_memory_mb': None if memory is None else _peak_memory() - memory,
+                  'pickled_bytes': len(pickle.dumps(classifier, pickle.HIGHEST_PROTOCOL)),
+                  'holdout_accuracy': accuracy_score(y[test], predictions)}
+
+
+def _encode(data):
+    # Samples as a float array and labels as integer codes.
+    x = np.ascontiguousarray(data[0])
+    if x.dtype != np.float32:
+        x = x.astype(np.float64)
+    # Labels may be strings; workers see integer codes.
+    classes, y = np.unique(np.asarray(data[1]), return_inverse=True)
+    return x, y.astype(np.int32)
+
+
+def _map(function, jobs, x, y, folds, processes=None, isolated=False):
+    # Runs jobs on a pool of workers sharing x, y and folds. Isolated
+    # jobs run one at a time, each in a fresh process.
+    if isolated:
+        processes, tasks = 1, 1
+    else:
+        processes, tasks = min(processes or multiprocessing.cpu_count(), len(jobs)), None
+        if processes == 1:
+            _attach(x, x.dtype, x.shape, y, folds)
+            return [function(job) for job in jobs]
+    shared = (_share(x, 'f' if x.dtype == np.float32 else 'd'), x.dtype, x.shape,
+              _share(y, 'i'), folds)
+    pool = multiprocessing.Pool(processes, _attach, shared, tasks)
+    try:
+        return pool.map(function, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _fresh(classifier, seed):
+    model = clone(classifier)
+    if model.get_params().get('random_state', 0) is None:
+        model.set_params(random_state=seed)
+    return model
+
+
+def fold_indices(n, k, seed=0, shuffle=True):
+    # type: (int, int) -> list
+    """
+    Splits sample indices into k folds.
+
+    :param n: Number of samples.
+    :param k: Number of folds.
+    :param seed: Seed of the shuffle, so splits are reproducible.
+    :param shuffle: Whether to shuffle samples before splitting.
+    :return: A list of k arrays of test indices.
+    """
+    order = np.random.RandomState(seed).permutation(n) if shuffle else np.arange(n)
+    return np.array_split(order, k)
+
+
+def cross_validate(k, data, classifiers, seed=0, shuffle=True, processes=None):
+    # type: (int, tuple, dict) -> dict
+    """
+    Performs k-fold cross-validation of several classifiers,
+    running every (classifier, fold) pair as a separate job on
+    a process pool. Each job fits a fresh clone of its
+    classifier on the other k-1 folds. Samples are placed in
+    shared memory once rather than copied to every job.
+
+    :param k: Number of bins to generate from data.
+    :param data: Tuple of samples and their labels as arrays.
+    :param classifiers: Dictionary of names to classifiers.
+    :param seed: Seed for the splits and for classifiers
+                 that take a random_state.
+    :param shuffle: Whether to shuffle samples before splitting.
+    :param processes: Worker processes, default of one per core;
+                      1 runs every job in this process.
+    :return: A dictionary of names to the k accuracy scores.
+    """
+    if k < 2:
+        raise ValueError('k-fold cross-validation needs k of at least 2.')
+    x, y = _encode(data)
+    folds = fold_indices(len(x), k, seed, shuffle)
+    jobs = [(name, _fresh(classifier, seed), i)
+            for name, classifier in sorted(classifiers.items()) for i in range(k)]
+    results = _map(_run_fold, jobs, x, y, folds, processes)
+
+    scores = {name: [None] * k for name in classifiers}
+    for name, i, score in results:
+        scores[name][i] = score
+    return scores
+
+
+def k_fold_cv(k, data, classifier=None, seed=0, shuffle=True, processes=None):
     # type: (int, tuple) -> list
     """
     Performs k-fold cross-validation using a designated
     classifier.
 
     :param k: Number of bins to generate from data.
-    :param data: Tuple of samples and their labelsf as arrays.
-    :param classifier: Machine learning classifier to use.
+    :param data: Tuple of samples and their labels as arrays.
+    :param classifier: Machine learning classifier to use,
+                       default of SVC(). It is cloned per bin.
+    :param seed: Seed for the splits.
+    :param shuffle: Whether to shuffle samples before splitting.
+    :param processes: Worker processes, see cross_validate.
     :return: A list of all accuracy scores gotten from each bin.
     """
-    scores = []
-    x_folds = np.array_split(data[0], k)
-    y_folds = np.array_split(data[1], k)
-    for i in range(k):
-        training_x = list(x_folds).pop(i)
-        training_y = list(y_folds).pop(i)
-        test_x = x_folds[i]
-        test_y = y_folds[i]
-        classifier.fit(training_x, training_y)
-        scores.append(accuracy_score(test_y, classifier.predict(test_x)))
-    return scores
+    classifier = SVC() if classifier is None else classifier
+    return cross_validate(k, data, {'model': classifier}, seed, shuffle, processes)['model']
 
 
-def model_comparison_classification(k, data):
+def model_comparison_classification(k, data, seed=0, processes=None):
     # type: (int, tuple) -> dict
     """
     Compares various classification models and
     their performance in analyzing a dataset
-    using k-fold cross-validation.
+    using k-fold cross-validation. Every model and
+    bin is fit in parallel.
 
     :param k: How many bins.
     :param data: Data of samples and their labels.
+    :param seed: Seed for the splits and models.
+    :param processes: Worker processes, see cross_validate.
     :return: A dictionary with keys being names
              of classifiers and values being the
              k bins and their accuracy scores.
     """
-    models = {clf: None for clf in ['SVM', 'Passive-Agressive',
-                                    'Bernoulli', 'Multilayered Perceptron']}
     # Data for k-fold cross-validation on various models.
-    cv_results = [k_fold_cv(k, data, c) for c in [SVC(),
-                                                  linear.PassiveAggressiveClassifier(),
-                                                  bayes.BernoulliNB(),
-                                                  neural.MLPClassifier()]]
-    models['SVM'] = cv_results[0]
-    models['Passive-Agressive'] = cv_results[1]
-    models['Bernoulli'] = cv_results[2]
-    models['Multilayered Perceptron'] = cv_results[3]
-
-    return models
-
-
-def plot_model_comparison(data, title, xlab, ylab):
-    for k in data:
-        plt.plot(data[k], label=k)
-    plt.title(title)
-    plt.xlabel(xlab)
-    plt.ylabel(ylab)
-    plt.legend()
-    plt.show()
+    return cross_validate(k, data, comparison_classifiers(), seed, processes=processes)
+
+
+def comparison_classifiers():
+    # type: () -> dict
+    """
+    :return: A dictionary of names to the classifiers
+             compared for the speech classifier.
+    """
+    return {'SVM': SVC(),
+            'Passive-Agressive': linear.PassiveAggressiveClassifier(),
+            'Bernoulli': bayes.BernoulliNB(),
+            'Multilayered Perceptron': neural.MLPClassifier()}
+
+
+def benchmark_classifiers(data, classifiers=None, k=5, rows=200, seed=0, processes=None):
+    # type: (tuple) -> dict
+    """
+    Benchmarks classifiers for use on the live prediction
+    path. Accuracy comes from k-fold cross-validation; the
+    costs from fitting on all bins but one and predicting
+    the held-out bin. Cost measurements run one classifier
+    at a time, each in a fresh process, so they neither
+    contend for cores nor share a memory peak.
+
+    :param data: Tuple of samples and their labels as arrays.
+    :param classifiers: Dictionary of names to classifiers,
+                        default of comparison_classifiers().
+    :param k: Number of bins.
+    :param rows: Held-out rows predicted one at a time.
+    :param seed: Seed for the splits and models.
+    :param processes: Worker processes for cross-validation.
+    :return: A dictionary of names to dictionaries of metrics:
+             accuracy (mean, std and per bin), fit time,
+             single-row p50/p95 and batch predict latency,
+             peak memory increase and pickled size.
+    """
+    classifiers = comparison_classifiers() if classifiers is None else classifiers
+    scores = cross_validate(k, data, classifiers, seed, processes=processes)
+    x, y = _encode(data)
+    folds = fold_indices(len(x), k, seed)
+    jobs = [(name, _fresh(classifier, seed), 0, rows)
+            for name, classifier in sorted(classifiers.items())]
+    results = dict(_map(_benchmark_fold, jobs, x, y, folds, isolated=True))
+    for name in results:
+        results[name].update({'accuracy': scores[name],
+                              'accuracy_mean': float(np.mean(scores[name])),
+                              'accuracy_std': float(np.std(scores[name]))})
+    return results
+
+
+def write_benchmark_report(results, directory, corpus=None):
+    # type: (dict, str) -> None
+    """
+    Writes a benchmark report without a display: the metrics
+    as JSON, a text table, and plots of accuracy per bin and
+    of accuracy against single-row latency.
+
+    :param results: Results of benchmark_classifiers.
+    :param directory: Directory to write the report to.
+    :param corpus: Optional name of the corpus benchmarked.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, 'benchmark.json'), 'w') as f:
+        json.dump({'corpus': corpus, 'models': results}, f, indent=2, sort_keys=True)
+    columns = ('accuracy_mean', 'fit_s', 'single_p50_ms', 'single_p95_ms',
+               'batch_per_row_ms', 'peak_memory_mb', 'pickled_bytes')
+    with open(os.path.join(directory, 'benchmark.txt'), 'w') as f:
+        if corpus:
+            f.write('Corpus: %s\n\n' % corpus)
+        f.write('%-25s' % 'MODEL' + ''.join('%18s' % c.upper() for c in columns) + '\n')
+        for name, metrics in sorted(results.items()):
+            f.write('%-25s' % name + ''.join(
+                '%18s' % ('-' if metrics[c] is None else
+                          '%d' % metrics[c] if c == 'pickled_bytes' else '%.4g' % metrics[c])
+                for c in columns) + '\n')
+    plot_model_comparison({name: m['accuracy'] for name, m in results.items()},
+                          'Accuracy per bin', 'Bin', 'Accuracy',
+                          os.path.join(directory, 'accuracy.png'))
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    figure = Figure()
+    axes = figure.add_subplot(111)
+    for name, m in sorted(results.items()):
+        axes.scatter(m['single_p95_ms'], m['accuracy_mean'], label=name)
+    axes.set_title('Accuracy against prediction latency')
+    axes.set_xlabel('Single-row predict p95 (ms)')
+    axes.set_ylabel('Mean accuracy')
+    axes.legend()
+    FigureCanvasAgg(figure).print_figure(os.path.join(directory, 'tradeoff.png'))
+
+
+def plot_model_comparison(data, title, xlab, ylab, filename=None):
+    """
+    Plots a line per key of data.
+
+    :param filename: File to save the plot to, drawn with the
+                     Agg backend; the plot is shown if None.
+    """
+    if filename is not None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        figure = Figure()
+        axes = figure.add_subplot(111)
+    else:
+        import matplotlib.pyplot as plt
+        axes = plt.gca()
+    for k in sorted(data):
+        axes.plot(data[k], label=k)
+    axes.set_title(title)
+    axes.set_xlabel(xlab)
+    axes.set_ylabel(ylab)
+    axes.legend()
+    if filename is not None:
+        FigureCanvasAgg(figure).print_figure(filename)
+    else:
+        plt.show()
+
+
+if __name__ == '__main__':
+    # E.g. python machine_learning_functions.py corpus.pickle report/
+    # where corpus.pickle holds a tuple of samples and labels.
+    import sys
+    corpus = pickle.load(open(sys.argv[1], 'rb'))
+    results = benchmark_classifiers(corpus)
+    write_benchmark_report(results, sys.argv[2], os.path.basename(sys.argv[1]))
+    print open(os.path.join(sys.argv[2], 'benchmark.txt')).read()
@@ -1,48 +1,63 @@
 # coding=utf-8
 import numpy as np
-from numpy import std, mean
-from pickle import load
-from naoqi import ALProxy
-from random import uniform
-from pylab import rcParams
+from nao_joints import ordered_joints
+from nao_proxy import proxy
+from gesture_dataset import load_statistics
+
+CHUNK = 4096  # Poses drawn per temporary in sample_poses.
 
 
 class NAOMotionDataAnalyzer():
     """
     Motion analysis and functional movement module. Takes given data in
     proper format (a dictionary of the 26 different sensors on NAO's body
-    whose values are all measurements taken of each sensor) belonging
-    to a certain category of movements.
+    whose values are all measurements taken of each sensor, either pickled
+    or in the columnar format of gesture_dataset) belonging to a certain
+    category of movements.
 
     Supports plotting movement distribution, and NAO can be controlled to
     generate new, natural movements based on statistical sampling from
     the data given.
     """
 
-    def __init__(self, filename, robot_ip='127.0.0.1'):
+    def __init__(self, filename, robot_ip='127.0.0.1', seed=None, wake_up=True):
         """
         Start a new instance of the motion analytics module. A NAO instance (whether
         simulated or physical) MUST be running when creating this module.
 
         :param filename: The name of the data file. Path relative to current directory.
         :param robot_ip: NAO's IP, in string format. Defaulted to 127.0.0.1 (Webots simulation).
+        :param seed: Seed for the pose generator, for reproducible motions.
+        :param wake_up: Whether to stop basic awareness and wake NAO up. Modules
+                        sharing a connection that is already awake can skip this.
         """
         # Initial constraints.
         self.file = filename
         self.ip = robot_ip
         self.port = 9559
-        # Load and process data.
-        self.data = load(open(filename, 'rb'))
-        self.means_stds = {k: (mean(self.data[k]), std(self.data[k]))
-                           for k in self.data}
-        self.data_bounds = {k: (self.means_stds[k][0] - self.means_stds[k][1],
-                                self.means_stds[k][0] + self.means_stds[k][1])
-                            for k in self.means_stds}
+        # Load the statistics only; samples stay on disk until plotted.
+        # Joint statistics are kept as arrays in a fixed joint order,
+        # with column i of every pose array belonging to joint_names[i].
+        names, means, stds = load_statistics(filename)
+        self.joint_names = ordered_joints(names)
+        self.joint_index = {j: i for i, j in enumerate(self.joint_names)}
+        order = [names.index(j) for j in self.joint_names]
+        self.means = means[order]
+        self.stds = stds[order]
+        self.lower = self.means - self.stds
+        self.span = 2 * self.stds
+        self.means_stds = {j: (self.means[i], self.stds[i])
+                           for j, i in self.joint_index.items()}
+        self.data_bounds = {j: (self.lower[i], self.lower[i] + self.span[i])
+                            for j, i in self.joint_index.items()}
+        self.random = np.random.RandomState(seed)
+        self.chain_columns = {}
         # Initialize listening proxies.
-        self.motion_proxy = ALProxy("ALMotion", self.ip, self.port)
-        self.awareness = ALProxy('ALBasicAwareness', self.ip, self.port)
-        self.awareness.stopAwareness()
-        self.motion_proxy.wakeUp()
+        self.motion_proxy = proxy("ALMotion", self.ip, self.port)
+        self.awareness = proxy('ALBasicAwareness', self.ip, self.port)
+        if wake_up:
+            self.awareness.stopAwareness()
+            self.motion_proxy.wakeUp()
         self.data = None
         self.last_move = None
 
@@ -57,31 +72,53 @@ class NAOMotionDataAnalyzer():
         self.reestablish_connection()
 
     def reestablish_connection(self):
-        self.motion_proxy = ALProxy("ALMotion", self.ip, self.port)
+        self.motion_proxy = proxy("ALMotion", self.ip, self.port)
+        self.motion_proxy.reconnect()
         self.motion_proxy.wakeUp()
 
-    def plot_distribution(self, save_directory, rug=False):
+    def plot_distribution(self, save_directory, rug=False, processes=None):
         """
         Using a kernel density estimate, plots sensor reading
         frequencies from the data given. Saves these 26 plots
-        to save_directory.
+        to save_directory. Densities are estimated for every
+        joint at once and the plots rendered in parallel
+        (see distribution_plots).
 
         :param save_directory: Directory to save plots in.
         :param rug: Whether or not to show a rug (color indicator)
-                    at the bottom of the plots. Takes significantly more time.
+                    at the bottom of the plots.
+        :param processes: Rendering processes, default of one per core.
+        """
+        from distribution_plots import plot_distributions
+        plot_distributions(self.file, save_directory, rug, processes)
+
+    def seed(self, seed=None):
         """
-        import seaborn as sns
-        import matplotlib.pyplot as plt
+        Reseeds the pose generator.
 
-        rcParams['figure.figsize'] = 5.5, 3.8  # Best for viewing.
-        for k in self.data.keys():
-            sns.distplot(self.data[k], hist=False, rug=rug)
-            plt.title(k + ' Sensor Distribution',
-                      fontdict={'fontsize': 14}, style='italic')
-            plt.xlabel("Angle (rad)")
-            plt.ylabel("Frequency")
-            plt.savefig(save_directory + '/' + k + '.pdf', bbox_inches='tight')
-            plt.clf()
+        :param seed: Integer seed, or None to seed from the OS.
+        """
+        self.random.seed(seed)
+
+    def sample_poses(self, n, out=None):
+        """
+        Draws n poses at once, each joint uniformly within one
+        standard deviation of its mean. Columns follow joint_names.
+
+        :param n: Number of poses to draw.
+        :param out: Optional preallocated (n, joints) float array to fill.
+                    It is filled CHUNK rows at a time, so only a
+                    chunk-sized temporary is allocated.
+        :return: The (n, joints) array of poses.
+        """
+        if out is None:
+            out = np.empty((n, len(self.joint_names)))
+        # Draws row by row, so the poses match those of one full draw.
+        for start in range(0, len(out), CHUNK):
+            rows = out[start:start + CHUNK]
+            np.multiply(self.random.random_sample(rows.shape), self.span, out=rows)
+            np.add(rows, self.lower, out=rows)
+        return out
 
     def generate_motion(self):
         """
@@ -90,12 +127,33 @@ class NAOMotionDataAnalyzer():
         that is statistically within the means of the dataset by its
         respective standard deviations.
         """
-        self.data = {k: uniform(
-            self.data_bounds[k][0], self.data_bounds[k][1]) for k in self.data_bounds}
+        self.data = dict(zip(self.joint_names, self.sample_poses(1)[0]))
 
     def get_joints(self, chain):
         return self.motion_proxy.getBodyNames(chain)
 
+    def columns(self, joints):
+        """
+        :param joints: List of joint names.
+        :return: Index array selecting those joints' columns from a pose array.
+        """
+        key = tuple(joints)
+        if key not in self.chain_columns:
+            self.chain_columns[key] = np.array([self.joint_index[j] for j in joints])
+        return self.chain_columns[key]
+
+    def segment(self):
+        """
+        Generates the target of one movement without moving NAO.
+
+        :return: Tuple (joints, angles) ready for angleInterpolation.
+        """
+        joints_of_interest = self.get_joints(
+            'LArm') + self.get_joints('RArm') + self.get_joints('Head')
+        angles = self.sample_poses(1)[0][self.columns(joints_of_interest)].tolist()
+        self.last_move = angles
+        return joints_of_interest, angles
+
     def move(self, time):
         """
         Generates new motion data and interpolates (moves) NAO
@@ -103,21 +161,38 @@ class NAOMotionDataAnalyzer():
 
         :param time: How long the animation should last.
         """
-        self.generate_motion()
-        joints_of_interest = self.get_joints(
-            'LArm') + self.get_joints('RArm') + self.get_joints('Head')
-        if self.last_move is not None:
-            angles = [self.data[joint] for joint in joints_of_interest]
-            # error = sum(np.absolute(
-            #     np.array(angles) - np.array(self.last_move)))
-            # epsilon = 0.3 * len(joints_of_interest)
-            # while error > epsilon:
-            self.generate_motion()
-            angles = [self.data[joint] for joint in joints_of_interest]
-            self.last_move = angles
-            # print 'Error:', error
-        else:
-            angles = [self.data[joint] for joint in joints_of_interest]
-            self.last_move = angles
+        joints_of_interest, angles = self.segment()
         self.motion_proxy.angleInterpolation(
             joints_of_interest, angles, time, True)
+
+    def trajectory(self, total_time, time):
+        """
+        Generates every keyframe of a movement at once, one
+        keyframe per time seconds over total_time.
+
+        :param total_time: How long the whole movement should last.
+        :param time: How long each keyframe's transition should last.
+        :return: Tuple (joints, angle_lists, time_lists) ready for a
+                 single angleInterpolation call.
+        """
+        joints_of_interest = self.get_joints(
+            'LArm') + self.get_joints('RArm') + self.get_joints('Head')
+        keyframes = int(total_time / time)
+        poses = self.sample_poses(keyframes)[:, self.columns(joints_of_interest)]
+        if keyframes:
+            self.last_move = poses[-1].tolist()
+        times = [time * (i + 1) for i in range(keyframes)]
+        return joints_of_interest, poses.T.tolist(), [times] * len(joints_of_interest)
+
+    def move_trajectory(self, total_time, time):
+        """
+        Moves NAO through every keyframe of a movement with a
+        single angleInterpolation call.
+
+        :param total_time: How long the whole movement should last.
+        :param time: How long each keyframe's transition should last.
+        """
+        joints_of_interest, angle_lists, time_lists = self.trajectory(total_time, time)
+        if time_lists[0]:
+            self.motion_proxy.angleInterpolation(
+                joints_of_interest, angle_lists, time_lists, True)
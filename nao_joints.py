@@ -0,0 +1,23 @@
+'''
+Joint naming shared by the modules that read from and
+write to NAO's body. The order below is the order in
+which ALMotion lists joints in its reports, and is the
+fixed column order of every joint array in this project.
+'''
+
+JOINT_NAMES = ['HeadYaw', 'HeadPitch', 'LShoulderPitch', 'LShoulderRoll', 'LElbowYaw', 'LElbowRoll',
+               'LWristYaw', 'LHipYawPitch', 'LHipRoll', 'LHipPitch', 'LKneePitch', 'LAnklePitch', 'LAnkleRoll',
+               'RHipYawPitch', 'RHipRoll', 'RHipPitch', 'RKneePitch', 'RAnklePitch', 'RAnkleRoll',
+               'RShoulderPitch', 'RShoulderRoll', 'RElbowYaw', 'RElbowRoll', 'RWristYaw', 'LHand', 'RHand']
+
+
+def ordered_joints(names):
+    '''
+    Orders a collection of joint names by JOINT_NAMES,
+    with any unknown names appended alphabetically.
+
+    :param names: Iterable of joint names.
+    :return: A list of the names in fixed order.
+    '''
+    names = set(names)
+    return [j for j in JOINT_NAMES if j in names] + sorted(names.difference(JOINT_NAMES))
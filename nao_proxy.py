@@ -0,0 +1,131 @@
+'''
+Shared, caching access to NAOqi modules.
+
+Every proxy handed out here wraps a plain ALProxy. Calls
+whose answers cannot change while a connection is open
+(chain joint names, installed behaviors, ...) are memoized,
+so repeated lookups cost no round trip to the robot. The
+cache is dropped whenever the proxy reconnects.
+
+Setting NAOQI_STANDIN=1 in the environment connects every
+proxy to the simulated robot of naoqi_standin instead.
+'''
+import os
+
+# Methods, per module, whose results stay the same for the
+# lifetime of a connection and are therefore safe to memoize.
+STATIC_METHODS = {
+    'ALMotion': ('getBodyNames', 'getJointNames', 'getLimits', 'getRobotConfig'),
+    'ALBehaviorManager': ('getInstalledBehaviors', 'getBehaviorNames'),
+}
+
+# Shared proxies, keyed by (module, ip, port).
+_proxies = {}
+
+
+def ALProxy(module, ip, port):
+    '''
+    Connects to a NAOqi module, on the robot or on the
+    local stand-in if NAOQI_STANDIN is set.
+    '''
+    if os.environ.get('NAOQI_STANDIN'):
+        from naoqi_standin import ALProxy as connect
+    else:
+        from naoqi import ALProxy as connect
+    return connect(module, ip, port)
+
+
+def _key(name, args):
+    # Lists are not hashable; NAOqi accepts them and tuples alike.
+    return (name,) + tuple(tuple(a) if isinstance(a, list) else a for a in args)
+
+
+class CachingProxy():
+    """
+    A proxy to one NAOqi module that memoizes its static calls.
+    Any other attribute (including post) is passed through to
+    the underlying ALProxy untouched.
+    """
+
+    def __init__(self, module, ip='127.0.0.1', port=9559, cached=None):
+        """
+        :param module: Name of module. Must be a string.
+        :param ip: NAO's IP, in string format.
+        :param port: Port NAOqi listens on.
+        :param cached: Method names to memoize. Defaulted to
+                       the module's entry in STATIC_METHODS.
+        """
+        self.module = module
+        self.ip = ip
+        self.port = port
+        self.cached = frozenset(STATIC_METHODS.get(module, ()) if cached is None else cached)
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.proxy = ALProxy(module, ip, port)
+
+    def __getattr__(self, name):
+        attr = getattr(self.proxy, name)
+        if name not in self.cached:
+            return attr
+
+        def memoized(*args):
+            key = _key(name, args)
+            if key in self.cache:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.cache[key] = attr(*args)
+            result = self.cache[key]
+            # Hand out copies so callers cannot corrupt the cache.
+            return list(result) if isinstance(result, list) else result
+        return memoized
+
+    def __str__(self):
+        return self.module + ' AT ' + self.ip + ':' + str(self.port) + \
+            ' (CACHE HITS: ' + str(self.hits) + ', MISSES: ' + str(self.misses) + ')'
+
+    def invalidate(self):
+        """
+        Forgets every memoized result.
+        """
+        self.cache.clear()
+
+    def reconnect(self):
+        """
+        Opens a fresh connection to the module and
+        invalidates the cache, since the robot on the
+        other end may have changed.
+        """
+        self.proxy = ALProxy(self.module, self.ip, self.port)
+        self.invalidate()
+
+    def stats(self):
+        """
+        :return: Dictionary of cache hits, misses and hit rate.
+        """
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': float(self.hits) / calls if calls else 0.0}
+
+
+def proxy(module, ip='127.0.0.1', port=9559):
+    '''
+    Returns the shared caching proxy to the corresponding
+    NAOqi module, creating it on first use.
+
+    :param module: Name of module. Must be a string.
+    :return: A CachingProxy to module, running on ip and port.
+    '''
+    key = (module, ip, port)
+    if key not in _proxies:
+        _proxies[key] = CachingProxy(module, ip, port)
+    return _proxies[key]
+
+
+def reconnect_all():
+    '''
+    Reconnects every shared proxy, invalidating all caches.
+    '''
+    for p in _proxies.values():
+        p.reconnect()
@@ -0,0 +1,428 @@
+'''
+A local, in-process stand-in for the NAOqi modules this
+project talks to: ALMotion, ALBehaviorManager,
+ALAnimatedSpeech, ALTextToSpeech, ALBasicAwareness,
+ALRobotPosture and ALSystem. It lets every script run
+without a robot or Webots, e.g. for benchmarks and
+regression runs on an ordinary Linux machine.
+
+Each call pays a configurable network latency plus random
+jitter. Movements, behaviors and speech take simulated time
+(scaled by time_scale) and can be run through post, waited
+on and stopped like real NAOqi tasks. getSummary returns
+reports in ALMotion's text format.
+
+To route nao_proxy through it, set NAOQI_STANDIN=1 in the
+environment; NAOQI_STANDIN_LATENCY, NAOQI_STANDIN_JITTER and
+NAOQI_STANDIN_TIME_SCALE set the defaults below.
+'''
+import os
+import re
+import math
+import random
+import threading
+from time import time, sleep
+from nao_joints import JOINT_NAMES
+
+CHAINS = {'Head': JOINT_NAMES[0:2], 'LArm': JOINT_NAMES[2:7] + ['LHand'],
+          'LLeg': JOINT_NAMES[7:13], 'RLeg': JOINT_NAMES[13:19],
+          'RArm': JOINT_NAMES[19:24] + ['RHand'], 'Body': list(JOINT_NAMES)}
+CHAINS['JointActuators'] = CHAINS['Body']
+
+# Behaviors installed by default, with their durations in seconds.
+BEHAVIORS = {'animations/Stand/Gestures/Yes_1': 2.4, 'animations/Stand/Gestures/No_3': 2.8,
+             'animations/Stand/Gestures/Hey_1': 3.1, 'animations/Stand/Gestures/Explain_1': 3.6,
+             'animations/Stand/BodyTalk/BodyTalk_1': 4.2, 'animations/Sit/BodyTalk/BodyTalk_1': 3.9}
+
+SPEECH_RATE = 0.32  # Seconds per spoken word.
+ANNOTATION = re.compile(r'\^\w+\(([^)]*)\)')
+
+settings = {'latency': float(os.environ.get('NAOQI_STANDIN_LATENCY', 0.0)),
+            'jitter': float(os.environ.get('NAOQI_STANDIN_JITTER', 0.0)),
+            'time_scale': float(os.environ.get('NAOQI_STANDIN_TIME_SCALE', 1.0)),
+            'behaviors': dict(BEHAVIORS)}
+_random = random.Random()
+_robots = {}
+_lock = threading.Lock()
+
+
+def configure(latency=None, jitter=None, time_scale=None, behaviors=None, seed=None):
+    '''
+    Changes the simulated network and robot. Arguments left
+    as None keep their current value.
+
+    :param latency: Mean delay of every call, in seconds.
+    :param jitter: Standard deviation of the delay, in seconds.
+    :param time_scale: Factor applied to every simulated duration.
+    :param behaviors: Dictionary of behavior names to durations,
+                      for robots created from now on.
+    :param seed: Seed for the jitter and simulated sensor noise.
+    '''
+    for key, value in [('latency', latency), ('jitter', jitter),
+                       ('time_scale', time_scale), ('behaviors', behaviors)]:
+        if value is not None:
+            settings[key] = value
+    if seed is not None:
+        _random.seed(seed)
+
+
+def reset():
+    '''
+    Forgets every simulated robot.
+    '''
+    with _lock:
+        _robots.clear()
+
+
+def robot(ip='127.0.0.1', port=9559):
+    '''
+    :return: The simulated robot at ip and port, created on first use.
+    '''
+    with _lock:
+        if (ip, port) not in _robots:
+            _robots[(ip, port)] = Robot(settings['behaviors'])
+        return _robots[(ip, port)]
+
+
+def _names(names):
+    # NAOqi accepts a joint, a chain or a list of joints.
+    if isinstance(names, (list, tuple)):
+        return list(names)
+    return list(CHAINS.get(names, [names]))
+
+
+def _per_joint(value, count):
+    # Expands a scalar or list argument to one entry per joint.
+    if isinstance(value, (list, tuple)) and len(value) == count and count > 1:
+        return list(value)
+    if isinstance(value, (list, tuple)) and count == 1:
+        return [value]
+    return [value] * count
+
+
+class Robot():
+    """
+    Simulated state of one NAO: joint angles and stiffnesses,
+    interpolations in progress, running behaviors and tasks.
+    """
+
+    def __init__(self, behaviors):
+        self.lock = threading.Lock()
+        self.angles = {j: 0.0 for j in JOINT_NAMES}
+        self.stiffness = {j: 0.0 for j in JOINT_NAMES}
+        # Joint -> (start time, start angle, [(end time, angle), ...]).
+        self.motions = {}
+        self.behaviors = dict(behaviors)
+        self.running = {}
+        self.tasks = {}
+        self.next_task = 1
+        self.local = threading.local()
+        # Speech is queued: one say at a time.
+        self.voice = threading.Lock()
+
+    def wait(self, duration):
+        '''
+        Sleeps for a simulated duration.
+
+        :return: False if the calling task was stopped meanwhile.
+        '''
+        duration *= settings['time_scale']
+        stop = getattr(self.local, 'stop', None)
+        if stop is None:
+            sleep(max(0.0, duration))
+            return True
+        return not stop.wait(max(0.0, duration))
+
+    def angle(self, joint, now):
+        start, angle, keyframes = self.motions.get(joint, (now, self.angles[joint], []))
+        for end, target in keyframes:
+            if now < end:
+                return angle + (target - angle) * (now - start) / (end - start)
+            start, angle = end, target
+        return angle
+
+    def settle(self, now):
+        for joint in list(self.motions):
+            self.angles[joint] = self.angle(joint, now)
+            if now >= self.motions[joint][2][-1][0]:
+                del self.motions[joint]
+
+    def offset(self, joint, now):
+        # Running behaviors sway the joints they drive.
+        total = 0.0
+        for name, (start, end) in self.running.items():
+            if now < end:
+                phase = hash(name + joint) % 628 / 100.0
+                total += 0.3 * math.sin(2 * math.pi * (now - start) / 1.7 + phase)
+        return total
+
+    def start_task(self):
+        with self.lock:
+            task = self.next_task
+            self.next_task += 1
+            self.tasks[task] = threading.Event()
+            return task, self.tasks[task]
+
+    def finish_task(self, task):
+        with self.lock:
+            self.tasks.pop(task, None)
+
+
+class StandInModule(object):
+    """
+    Base class for simulated modules. Methods common to
+    every NAOqi module (task handling) live here.
+    """
+
+    def __init__(self, robot):
+        self.robot = robot
+
+    def wait(self, task, timeout):
+        '''
+        :param timeout: Milliseconds to wait, 0 for no limit.
+        :return: Whether the task has finished.
+        '''
+        with self.robot.lock:
+            done = self.robot.tasks.get(task)
+        if done is None:
+            return True
+        deadline = None if not timeout else time() + timeout / 1000.0
+        while task in self.robot.tasks:
+            if deadline is not None and time() >= deadline:
+                return False
+            sleep(0.001)
+        return True
+
+    def isRunning(self, task):
+        return task in self.robot.tasks
+
+    def stop(self, task):
+        with self.robot.lock:
+            event = self.robot.tasks.get(task)
+        if event is not None:
+            event.set()
+
+
+class ALMotion(StandInModule):
+
+    def wakeUp(self):
+        with self.robot.lock:
+            for j in JOINT_NAMES:
+                self.robot.stiffness[j] = 1.0
+
+    def rest(self):
+        with self.robot.lock:
+            for j in JOINT_NAMES:
+                self.robot.stiffness[j] = 0.0
+
+    def getBodyNames(self, chain):
+        return _names(chain)
+
+    def getJointNames(self, chain):
+        return _names(chain)
+
+    def getStiffnesses(self, names):
+        with self.robot.lock:
+            return [self.robot.stiffness[j] for j in _names(names)]
+
+    def setStiffnesses(self, names, stiffnesses):
+        names = _names(names)
+        with self.robot.lock:
+            for j, s in zip(names, _per_joint(stiffnesses, len(names))):
+                self.robot.stiffness[j] = float(s)
+
+    def getAngles(self, names, useSensors):
+        now = time()
+        with self.robot.lock:
+            angles = [self.robot.angle(j, now) + self.robot.offset(j, now) for j in _names(names)]
+        if useSensors:
+            angles = [a + _random.gauss(0.0, 0.002) for a in angles]
+        return angles
+
+    def angleInterpolation(self, names, angleLists, timeLists, isAbsolute):
+        names = _names(names)
+        angleLists = _per_joint(angleLists, len(names))
+        timeLists = _per_joint(timeLists, len(names))
+        scale = settings['time_scale']
+        now = time()
+        longest = 0.0
+        with self.robot.lock:
+            self.robot.settle(now)
+            for j, angles, times in zip(names, angleLists, timeLists):
+                if not isinstance(angles, (list, tuple)):
+                    angles, times = [angles], [times]
+                base = 0.0 if isAbsolute else self.robot.angles[j]
+                keyframes = [(now + t * scale, base + a) for a, t in zip(angles, times)]
+                self.robot.motions[j] = (now, self.robot.angle(j, now), keyframes)
+                longest = max(longest, times[-1])
+        if not self.robot.wait(longest):
+            # Stopped: freeze every joint where it is.
+            with self.robot.lock:
+                now = time()
+                for j in names:
+                    self.robot.angles[j] = self.robot.angle(j, now)
+                    self.robot.motions.pop(j, None)
+
+    def getSummary(self):
+        now = time()
+        lines = ['---------------------- Model ----------------------',
+                 '  BodyPart    Stiffness    Command    Sensor']
+        with self.robot.lock:
+            for j in JOINT_NAMES:
+                command = self.robot.angle(j, now) + self.robot.offset(j, now)
+                lines.append('  %-15s %6.2f %10.4f %10.4f' % (
+                    j, self.robot.stiffness[j], command, command + _random.gauss(0.0, 0.002)))
+            moving = len(self.robot.motions)
+        lines += ['', '---------------------- Tasks ----------------------',
+                  '  Name                  ID   Remaining Duration', ]
+        if moving:
+            lines.append('  angleInterpolation    1   0.00')
+        lines += ['', '----------------- Stiffness Tasks -----------------', '']
+        return '\n'.join(lines)
+
+
+class ALBehaviorManager(StandInModule):
+
+    def getInstalledBehaviors(self):
+        return sorted(self.robot.behaviors)
+
+    def getBehaviorNames(self):
+        return sorted(self.robot.behaviors)
+
+    def isBehaviorInstalled(self, name):
+        return name in self.robot.behaviors
+
+    def isBehaviorRunning(self, name):
+        with self.robot.lock:
+            return name in self.robot.running and time() < self.robot.running[name][1]
+
+    def getRunningBehaviors(self):
+        return [b for b in list(self.robot.running) if self.isBehaviorRunning(b)]
+
+    def runBehavior(self, name):
+        duration = self.robot.behaviors.get(name, 0.0)
+        start = time()
+        with self.robot.lock:
+            self.robot.running[name] = (start, start + duration * settings['time_scale'])
+        self.robot.wait(duration)
+        with self.robot.lock:
+            self.robot.running.pop(name, None)
+
+    def stopBehavior(self, name):
+        with self.robot.lock:
+            self.robot.running.pop(name, None)
+
+
+class ALTextToSpeech(StandInModule):
+
+    def say(self, text, *args):
+        # Annotations such as ^start(...) are not spoken.
+        words = ANNOTATION.sub(' ', text).split()
+        with self.robot.voice:
+            self.robot.wait(SPEECH_RATE * len(words))
+
+
+class ALAnimatedSpeech(ALTextToSpeech):
+
+    def say(self, text, *args):
+        # ^run and ^wait suspend speech for the whole animation.
+        words = ANNOTATION.sub(' ', text).split()
+        extra = sum(self.robot.behaviors.get(a.strip(), 0.0)
+                    for a in re.findall(r'\^(?:run|wait)\(([^)]*)\)', text))
+        with self.robot.voice:
+            self.robot.wait(SPEECH_RATE * len(words) + extra)
+
+
+class ALBasicAwareness(StandInModule):
+
+    def startAwareness(self):
+        pass
+
+    def stopAwareness(self):
+        pass
+
+
+class ALRobotPosture(StandInModule):
+
+    def getPosture(self):
+        return getattr(self.robot, 'posture', 'Stand')
+
+    def goToPosture(self, name, speed):
+        self.robot.wait(1.0)
+        self.robot.posture = name
+        return True
+
+
+class ALSystem(StandInModule):
+
+    def systemVersion(self):
+        return '2.1.4.13'
+
+    def robotName(self):
+        return 'standin'
+
+
+MODULES = {'ALMotion': ALMotion, 'ALBehaviorManager': ALBehaviorManager,
+           'ALTextToSpeech': ALTextToSpeech, 'ALAnimatedSpeech': ALAnimatedSpeech,
+           'ALBasicAwareness': ALBasicAwareness, 'ALRobotPosture': ALRobotPosture,
+           'ALSystem': ALSystem}
+
+
+def _delay():
+    # Simulated network round trip.
+    delay = _random.gauss(settings['latency'], settings['jitter']) if settings['jitter'] \
+        else settings['latency']
+    if delay > 0:
+        sleep(delay)
+
+
+class _Post(object):
+    """
+    Runs module methods in the background, returning a task id
+    that can be passed to wait, isRunning and stop.
+    """
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        method = getattr(self._module, name)
+        robot = self._module.robot
+
+        def post(*args):
+            _delay()
+            task, stop = robot.start_task()
+
+            def run():
+                robot.local.stop = stop
+                try:
+                    method(*args)
+                finally:
+                    robot.finish_task(task)
+            worker = threading.Thread(target=run)
+            worker.daemon = True
+            worker.start()
+            return task
+        return post
+
+
+class ALProxy(object):
+    """
+    Drop-in replacement for naoqi.ALProxy backed by a
+    simulated robot. Every call pays the simulated latency.
+    """
+
+    def __init__(self, module, ip='127.0.0.1', port=9559):
+        if module not in MODULES:
+            raise RuntimeError('Stand-in has no module named ' + module)
+        _delay()
+        self._module = MODULES[module](robot(ip, port))
+        self.post = _Post(self._module)
+
+    def __getattr__(self, name):
+        method = getattr(self._module, name)
+
+        def call(*args):
+            _delay()
+            return method(*args)
+        return call
@@ -0,0 +1,184 @@
+'''
+Online learning from confirmed queries.
+
+Updating a classifier one query at a time is slow and noisy,
+and nothing learned survived a crash. An OnlineTrainer buffers
+confirmed examples and applies partial_fit in mini-batches on
+a background thread. After every batch it writes the model and
+the grown corpus to a single checkpoint file, replacing the
+old one only once the new one is complete. The prompt loop
+only ever enqueues.
+
+The trainer fits a copy of the model and hands the updated
+copy over when done, so predictions made meanwhile never see
+a half-updated model. A batch that fails to fit or checkpoint
+stays buffered for the next attempt, and the error is raised
+from the next add() or close().
+'''
+import os
+import copy
+import pickle
+import threading
+from Queue import Queue, Empty
+from numpy import array
+
+CHECKPOINT = 'pickles/online_checkpoint.pickle'
+
+
+def write_atomically(obj, filename):
+    '''
+    Pickles obj to filename through a temporary file, so the
+    file holds either the old or the new object, never part.
+    '''
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(temporary, filename)
+
+
+def load_checkpoint(filename=CHECKPOINT):
+    '''
+    :return: Dictionary with the model, corpus and categories
+             of the last checkpoint, or None if there is none.
+    '''
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+class OnlineTrainer(threading.Thread):
+    """
+    Background mini-batch trainer. Confirmed examples are
+    added with add(); the worker fits them batch_size at a
+    time, or whatever is buffered once no example has come
+    for idle seconds.
+    """
+
+    def __init__(self, model, corpus, categories, batch_size=16,
+                 idle=5.0, checkpoint=CHECKPOINT, on_update=None):
+        """
+        :param model: Fitted classifier supporting partial_fit.
+        :param corpus: Dictionary of categories to their sentences.
+        :param categories: List of categories, indexed by label.
+        :param batch_size: Examples per partial_fit.
+        :param idle: Seconds after which a partial batch is fit.
+        :param checkpoint: File to checkpoint to, or None.
+        :param on_update: Function called with every updated model.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.model = model
+        self.corpus = corpus
+        self.categories = categories
+        self.batch_size = batch_size
+        self.idle = idle
+        self.checkpoint = checkpoint
+        self.on_update = on_update
+        self.queue = Queue()
+        self.buffer = []
+        self.batches = 0
+        self.examples = 0
+        self.error = None
+        self.start()
+
+    def add(self, text, vector, label):
+        '''
+        Queues a confirmed example without blocking. Raises the
+        error of a batch that failed since, if any; the example
+        is queued regardless.
+
+        :param text: The query.
+        :param vector: The query's vector.
+        :param label: Its label, an index into categories.
+        '''
+        self.queue.put((text, vector, label))
+        self.raise_error()
+
+    def raise_error(self):
+        '''
+        Raises the last error of the worker once, if there was one.
+        '''
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def flush(self):
+        '''
+        Fits everything queued so far and waits until it is
+        checkpointed.
+        '''
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        '''
+        Flushes and stops the worker, raising the error of a
+        batch that could not be fit or checkpointed.
+        '''
+        self.flush()
+        self.queue.put(None)
+        self.join()
+        self.raise_error()
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle)
+            except Empty:
+                self.fit()
+                continue
+            if item is None:
+                return
+            if isinstance(item, tuple):
+                self.buffer.append(item)
+                if len(self.buffer) >= self.batch_size:
+                    self.fit()
+            else:
+                self.fit()
+                item.set()
+
+    def fit(self):
+        # Fits and checkpoints the buffered examples.
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            x = array([vector for text, vector, label in batch])
+            y = array([label for text, vector, label in batch])
+            model = copy.deepcopy(self.model)
+            model.partial_fit(x, y)
+            corpus = {k: list(v) for k, v in self.corpus.items()}
+            for text, vector, label in batch:
+                corpus[self.categories[label]].append(text)
+            if self.checkpoint:
+                write_atomically({'model': model, 'corpus': corpus,
+                                  'categories': self.categories}, self.checkpoint)
+        except Exception as e:
+            # Keep the worker alive and the batch for the next fit.
+            self.buffer = batch + self.buffer
+            self.error = e
+            return
+        for text, vector, label in batch:
+            self.corpus[self.categories[label]].append(text)
+        self.model = model
+        self.batches += 1
+        self.examples += len(batch)
+        if self.on_update:
+            try:
+                self.on_update(model)
+            except Exception as e:
+                self.error = e
+
+    def stats(self):
+        '''
+        :return: Dictionary of batches and examples fit, examples
+                 waiting and the last error, if any.
+        '''
+        return {'batches': self.batches, 'examples': self.examples,
+                'waiting': self.queue.qsize() + len(self.buffer), 'error': self.error}
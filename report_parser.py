@@ -0,0 +1,110 @@
+'''
+Parsing of ALMotion.getSummary() reports into NumPy arrays.
+
+A report starts with two header lines, followed by one
+line per joint of the form
+
+    BODYPART STIFFNESS COMMAND SENSOR
+
+and ends its joint data at the first line mentioning
+'Tasks'. A batch of reports parses into a float array of
+shape (reports, joints, 3), the last axis being FIELDS.
+'''
+import numpy as np
+from nao_joints import JOINT_NAMES
+
+FIELDS = ('stiffness', 'command', 'sensor')
+STIFFNESS, COMMAND, SENSOR = range(len(FIELDS))
+
+
+def report_tokens(report):
+    '''
+    :param report: One getSummary() report string.
+    :return: Whitespace-separated tokens of the report's joint lines.
+    '''
+    begin = report.find('\n', report.find('\n') + 1) + 1
+    end = report.find('Tasks', begin)
+    if end == -1:
+        end = len(report)
+    else:
+        # Cut at the start of the line holding 'Tasks'.
+        end = report.rfind('\n', begin, end) + 1 or begin
+    return report[begin:end].split()
+
+
+class ReportParser():
+    """
+    Turns batches of getSummary() reports into float arrays
+    with a fixed joint order. Reports that are missing joints
+    or hold non-numeric values are skipped and counted.
+    """
+
+    def __init__(self, joint_names=JOINT_NAMES):
+        """
+        :param joint_names: Joints to extract, in output order.
+        """
+        self.joint_names = list(joint_names)
+        self.joint_index = {j: i for i, j in enumerate(self.joint_names)}
+        self.parsed = 0
+        self.malformed = 0
+
+    def order(self, names):
+        # Row of the report holding each output joint, or None if any is missing.
+        rows = {n: i for i, n in enumerate(names)}
+        if len(rows) != len(names) or not all(j in rows for j in self.joint_names):
+            return None
+        return [rows[j] for j in self.joint_names]
+
+    def parse(self, reports):
+        """
+        Parses a batch of reports.
+
+        :param reports: List of getSummary() report strings.
+        :return: A tuple (values, kept), values being a float array
+                 of shape (len(kept), joints, 3) and kept the indices
+                 of the reports that parsed, in input order.
+        """
+        flat = []
+        kept = []
+        for i, report in enumerate(reports):
+            tokens = report_tokens(report)
+            if len(tokens) % 4:
+                continue
+            names = tokens[0::4]
+            if names == self.joint_names:
+                del tokens[0::4]
+                flat.extend(tokens)
+            else:
+                rows = self.order(names)
+                if rows is None:
+                    continue
+                for r in rows:
+                    flat.extend(tokens[4 * r + 1:4 * r + 4])
+            kept.append(i)
+        width = 3 * len(self.joint_names)
+        try:
+            values = np.array(flat, dtype=float)
+        except ValueError:
+            # Some report holds a non-numeric value; find and drop it.
+            good = []
+            for n in range(len(kept)):
+                try:
+                    good.append([float(t) for t in flat[n * width:(n + 1) * width]])
+                except ValueError:
+                    kept[n] = None
+            kept = [i for i in kept if i is not None]
+            values = np.array(good, dtype=float)
+        self.parsed += len(kept)
+        self.malformed += len(reports) - len(kept)
+        return values.reshape(len(kept), len(self.joint_names), len(FIELDS)), np.array(kept, dtype=int)
+
+
+def parse_reports(reports, joint_names=JOINT_NAMES):
+    '''
+    Parses a batch of reports with a fresh ReportParser.
+
+    :param reports: List of getSummary() report strings.
+    :param joint_names: Joints to extract, in output order.
+    :return: A tuple (values, kept) as in ReportParser.parse.
+    '''
+    return ReportParser(joint_names).parse(reports)
@@ -0,0 +1,96 @@
+'''
+Resampling of captured joint time series.
+
+Captures arrive as irregular timestamps with one row of
+joint angles per timestamp. The functions here turn them
+into evenly spaced frames, either at a fixed rate or by
+keeping samples at least a threshold apart, in time
+linear in the length of the capture.
+'''
+import numpy as np
+
+METHODS = ('nearest', 'linear')
+
+
+def threshold_indices(times, threshold):
+    '''
+    Picks samples greedily so that each kept sample comes
+    at least threshold seconds after the previously kept one,
+    starting with the first.
+
+    :param times: Nondecreasing array of timestamps.
+    :param threshold: Minimum spacing in seconds, positive.
+    :return: Array of indices of the kept samples.
+    '''
+    if not threshold > 0:
+        raise ValueError('Threshold must be positive: ' + str(threshold))
+    times = np.asarray(times, dtype=float)
+    if not len(times):
+        return np.array([], dtype=int)
+    keep = [0]
+    while True:
+        i = int(np.searchsorted(times, times[keep[-1]] + threshold))
+        if i >= len(times):
+            break
+        keep.append(i)
+    return np.array(keep, dtype=int)
+
+
+def interpolate(times, angles, grid, method='linear'):
+    '''
+    Evaluates a sampled series at new timestamps.
+
+    :param times: Nondecreasing array of n timestamps.
+    :param angles: Array of shape (n, joints).
+    :param grid: Timestamps to evaluate at.
+    :param method: 'nearest' or 'linear'.
+    :return: Array of shape (len(grid), joints).
+    '''
+    if method not in METHODS:
+        raise ValueError('Unknown interpolation method: ' + str(method))
+    times = np.asarray(times, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    if len(times) == 1:
+        return np.repeat(angles, len(grid), axis=0)
+    # Each grid point falls between samples right - 1 and right.
+    right = np.clip(np.searchsorted(times, grid, side='right'), 1, len(times) - 1)
+    left = right - 1
+    span = times[right] - times[left]
+    weight = np.clip((grid - times[left]) / np.where(span > 0, span, 1), 0, 1)
+    if method == 'nearest':
+        return angles[np.where(weight < 0.5, left, right)]
+    return angles[left] + weight[:, None] * (angles[right] - angles[left])
+
+
+def resample(times, angles, rate=None, threshold=None, method='linear'):
+    '''
+    Resamples a capture to fixed-rate or threshold-spaced frames.
+    Exactly one of rate and threshold must be given.
+
+    :param times: Nondecreasing array of n timestamps, in seconds.
+    :param angles: Array of shape (n, joints).
+    :param rate: Frames per second of a fixed-rate grid starting
+                 at the first timestamp, positive. Frames are
+                 interpolated.
+    :param threshold: Minimum spacing in seconds between kept
+                      samples, positive. Frames are the original
+                      samples.
+    :param method: Interpolation for fixed-rate frames,
+                   'nearest' or 'linear'.
+    :return: Tuple (times, angles) of the resampled frames.
+    '''
+    if (rate is None) == (threshold is None):
+        raise ValueError('Give exactly one of rate and threshold.')
+    if rate is not None and not rate > 0:
+        raise ValueError('Rate must be positive: ' + str(rate))
+    times = np.asarray(times, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    if not len(times):
+        return times, angles
+    if threshold is not None:
+        keep = threshold_indices(times, threshold)
+        return times[keep], angles[keep]
+    frames = int(np.floor((times[-1] - times[0]) * rate)) + 1
+    grid = times[0] + np.arange(frames) / float(rate)
+    return grid, interpolate(times, angles, grid, method)
@@ -0,0 +1,167 @@
+'''
+A persistent catalog of how long NAO's animations take.
+
+Every animation is keyed by its full behavior path, e.g.
+animations/Stand/Gestures/Yes_1, which names both the
+animation and the posture it is played from. Entries record
+the measured durations, when they were measured and on which
+firmware, so only missing or stale entries need measuring
+again (see gesture_timing_measurement.py). Schedulers look
+durations up to plan timing without running the animation.
+'''
+import os
+import re
+import json
+from time import time
+
+CATALOG = '../pickles/gesture_durations.json'
+VERSION = 1
+SAMPLES = 5  # Measurements kept per animation.
+ANNOTATION = re.compile(r'\^\w+\([^)]*\)')
+SUSPENDING = re.compile(r'\^(run|wait)\(([^)]*)\)')
+
+
+def split_path(path):
+    '''
+    :param path: Full behavior path of an animation.
+    :return: Tuple (name, posture), e.g. ('Yes_1', 'Stand').
+    '''
+    parts = path.split('/')
+    return parts[-1], parts[1] if len(parts) > 2 else ''
+
+
+class DurationCatalog():
+    """
+    Measured durations of animations, saved as JSON.
+    """
+
+    def __init__(self, filename=CATALOG):
+        """
+        :param filename: File the catalog is kept in; loaded if it exists.
+        """
+        self.filename = filename
+        self.entries = {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                data = json.load(f)
+            if data.get('version') == VERSION:
+                self.entries = data['entries']
+        self.index = {}
+        for path in self.entries:
+            self.index[split_path(path)] = path
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def path(self, animation, posture=None):
+        '''
+        :param animation: Full behavior path, or the animation's name.
+        :param posture: Posture the named animation is played from,
+                        e.g. 'Stand'; 'Stand' is tried if None.
+        :return: The full path of the catalogued animation, or None.
+        '''
+        if animation in self.entries:
+            return animation
+        if posture is not None:
+            return self.index.get((animation, posture))
+        return self.index.get((animation, 'Stand')) or \
+            next((p for (n, _), p in sorted(self.index.items()) if n == animation), None)
+
+    def duration(self, animation, posture=None, default=None):
+        '''
+        :param animation: Full behavior path, or the animation's name.
+        :param posture: Posture of a named animation.
+        :param default: Returned for animations not in the catalog.
+        :return: Median measured duration in seconds.
+        '''
+        path = self.path(animation, posture)
+        return default if path is None else self.entries[path]['duration']
+
+    def message_time(self, message, rate, default=0.0):
+        '''
+        Estimates how long an ALAnimatedSpeech message takes:
+        its words at the given rate, plus every ^run animation,
+        and at least as long as every ^wait animation (started
+        along with the speech).
+
+        :param message: Message in ALAnimatedSpeech form.
+        :param rate: Seconds per spoken word.
+        :param default: Duration assumed for unknown animations.
+        :return: Estimated duration in seconds.
+        '''
+        run, waited = self.animation_times(message, default)
+        return max(rate * len(ANNOTATION.sub(' ', message).split()) + run, waited)
+
+    def animation_times(self, message, default=0.0):
+        '''
+        :param message: Message in ALAnimatedSpeech form.
+        :param default: Duration assumed for unknown animations.
+        :return: Tuple (run, waited) of the total duration of the
+                 message's ^run animations, which add to its
+                 speech, and the longest of its ^wait animations,
+                 which run along with it.
+        '''
+        run = 0.0
+        waited = 0.0
+        for command, animation in SUSPENDING.findall(message):
+            duration = self.duration(animation.strip(), default=default)
+            if command == 'run':
+                run += duration
+            else:
+                waited = max(waited, duration)
+        return run, waited
+
+    def record(self, path, duration, firmware):
+        '''
+        Adds a measurement, discarding those taken on other firmware.
+
+        :param path: Full behavior path of the animation.
+        :param duration: Measured duration in seconds.
+        :param firmware: NAOqi version the measurement was taken on.
+        '''
+        entry = self.entries.get(path)
+        if entry is None or entry['firmware'] != firmware:
+            name, posture = split_path(path)
+            entry = {'name': name, 'posture': posture, 'firmware': firmware, 'samples': []}
+            self.entries[path] = entry
+            self.index[(name, posture)] = path
+        entry['samples'] = (entry['samples'] + [duration])[-SAMPLES:]
+        samples = sorted(entry['samples'])
+        entry['duration'] = samples[len(samples) // 2]
+        entry['measured'] = time()
+
+    def stale(self, paths, firmware, max_age=None, samples=1):
+        '''
+        :param paths: Full behavior paths of the animations wanted.
+        :param firmware: NAOqi version of the robot.
+        :param max_age: Seconds after which entries are stale, or None.
+        :param samples: Least number of measurements wanted.
+        :return: The paths that are missing, measured on other
+                 firmware, too old or measured too few times.
+        '''
+        now = time()
+        stale = []
+        for path in paths:
+            entry = self.entries.get(path)
+            if entry is None or entry['firmware'] != firmware or len(entry['samples']) < samples \
+                    or (max_age is not None and now - entry['measured'] > max_age):
+                stale.append(path)
+        return stale
+
+    def save(self):
+        '''
+        Writes the catalog, replacing the old file only once
+        the new one is complete.
+        '''
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'version': VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(temporary, self.filename)
@@ -1,22 +1,93 @@
-from naoqi import ALProxy as Proxy
-from read_animations import animations_dict, run
+'''
+Measures how long NAO's animations take and saves the
+results to the duration catalog (see gesture_durations.py).
+Only animations that are missing from the catalog, were
+measured on other firmware or are older than --max-age days
+are measured, and the catalog is saved after every one, so
+an interrupted run picks up where it stopped. Run from this
+directory, e.g.
+
+    python gesture_timing_measurement.py --ip 192.168.0.10
+    python gesture_timing_measurement.py --all --repeats 3
+'''
+import sys
+sys.path.append('..')
+from nao_proxy import proxy as Proxy
+from read_animations import animations
+from gesture_durations import DurationCatalog, split_path
+from optparse import OptionParser
 from time import sleep
 from time import time
 
-def proxy(module):
-    return Proxy(module, "192.168.0.10", 9559)
 
-speech = proxy("ALAnimatedSpeech")
-behavior = proxy("ALBehaviorManager")
+def measure(behavior, path):
+    '''
+    :param behavior: ALBehaviorManager proxy.
+    :param path: Full behavior path of the animation.
+    :return: Seconds the animation took to run.
+    '''
+    start = time()
+    behavior.runBehavior(path)
+    return time() - start
 
-gesture_times = {g : 0 for g in animations_dict.keys()}
-configuration = {"bodyLanguageMode" : "disabled"}
 
-for gesture in animations_dict.keys():
-    # ------MEASURING GESTURE TIME...------
-    start = time()
-    speech.say(run(gesture), configuration)
-    elapsed = time() - start
-    # ------------------------------------
-    gesture_times[gesture] += elapsed
-    sleep(15) # Delay before moving on.
+def measure_stale(catalog, ip="192.168.0.10", port=9559, max_age=None,
+                  repeats=1, pause=3.0, everything=False):
+    '''
+    Measures the animations of read_animations whose catalog
+    entries are stale, grouped by posture.
+
+    :param catalog: The DurationCatalog to update.
+    :param ip: NAO's IP, in string format.
+    :param port: Hosting port for NAO's interface.
+    :param max_age: Seconds after which entries are stale, or None.
+    :param repeats: Measurements wanted per animation.
+    :param pause: Seconds to rest between animations.
+    :param everything: Whether to measure every animation again.
+    :return: List of the paths measured.
+    '''
+    behavior = Proxy("ALBehaviorManager", ip, port)
+    posture = Proxy("ALRobotPosture", ip, port)
+    firmware = Proxy("ALSystem", ip, port).systemVersion()
+    paths = sorted(set(a[1] for a in animations), key=lambda p: (split_path(p)[1], p))
+    stale = paths if everything else catalog.stale(paths, firmware, max_age, repeats)
+    installed = set(behavior.getInstalledBehaviors())
+    print len(stale), 'of', len(paths), 'animations to measure on NAOqi', firmware
+    measured = []
+    current = None
+    for path in stale:
+        if path not in installed:
+            print '  Skipping', path, '(not installed).'
+            continue
+        name, pose = split_path(path)
+        if pose != current:
+            posture.goToPosture(pose, 0.5)
+            current = pose
+        entry = catalog.entries.get(path)
+        done = 0 if everything or entry is None or entry['firmware'] != firmware \
+            else len(entry['samples'])
+        for i in range(max(1, repeats - done)):
+            catalog.record(path, measure(behavior, path), firmware)
+            sleep(pause) # Delay before moving on.
+        catalog.save()
+        measured.append(path)
+        print '  %-50s %6.2f s' % (path, catalog.entries[path]['duration'])
+    return measured
+
+
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--ip', dest='ip', help='NAO\'s IP address.')
+    parser.add_option('--catalog', dest='catalog', help='Duration catalog file.')
+    parser.add_option('--max-age', type='float', dest='max_age',
+                      help='Days after which measurements are stale.')
+    parser.add_option('--repeats', type='int', dest='repeats', help='Measurements per animation.')
+    parser.add_option('--pause', type='float', dest='pause', help='Seconds between animations.')
+    parser.add_option('--all', action='store_true', dest='everything',
+                      help='Measure every animation again.')
+    parser.set_defaults(ip='192.168.0.10', repeats=1, pause=3.0)
+    (opts, args_) = parser.parse_args()
+    catalog = DurationCatalog(opts.catalog) if opts.catalog else DurationCatalog()
+    max_age = opts.max_age * 86400 if opts.max_age is not None else None
+    measure_stale(catalog, opts.ip, max_age=max_age, repeats=opts.repeats,
+                  pause=opts.pause, everything=opts.everything)
@@ -1,66 +1,113 @@
+import sys
 import spacy
 import pickle
+import numpy as np
+from optparse import OptionParser
 from read_animations import grouped_tags
+sys.path.append('..')
+from vector_index import VectorIndex, unit_rows
+
+# A prebuilt vector index (see vector_index.py) can answer the
+# similarity search instead of a full vocabulary scan, when asked
+# to with --index. It probes every cluster, so the words are the
+# same, unless --probes trades exactness for speed.
+INDEX_DIRECTORY = '../pickles/vocab_index'
 
 # Load medium-sized corpus/model for vocabulary analysis.
 nlp = spacy.load("en_vectors_glove_md")
 vocabulary = nlp.vocab
 
-def sim(a, b):
+# The 9 vocabulary lists that will be classified per section: each
+# category's seed phrases, and how similar a word must be to any of
+# them to belong to it.
+CATEGORIES = [('greeting', ["hello", "goodbye", "greetings", "hey there!", "hi"], 0.75),
+              ('self', ["me", "I", "my", "our", "this"], 0.8),
+              ('uncertain', grouped_tags['uncertain'], 0.75),
+              ('disagree', ["no", "not", "nah", "never", "definitely not", "no, thanks"], 0.75),
+              ('other', ["you", "your", "that", "their"], 0.8),
+              ('tell', grouped_tags['tell'], 0.75),
+              ('ask', grouped_tags['ask'], 0.6),
+              ('agree', grouped_tags['agree'], 0.73),
+              ('good', grouped_tags['good'] + ['excited'], 0.73)]
+
+
+def group_vocabulary(categories, chunk_size=20000):
     '''
-    Computes the vector similarity between
-    phrase a and phrase b.
-    :return: Similarity weight.
+    Finds, for every category, the words of the vocabulary whose
+    cosine similarity to any of its seed phrases reaches the
+    category's threshold. Seeds are embedded once and every
+    word is scored against all seeds of all categories at once,
+    chunk_size words per matrix multiply.
+
+    :param categories: List of (name, seed phrases, threshold).
+    :param chunk_size: Words scored per matrix multiply.
+    :return: Dictionary of category names to sets of lexemes.
     '''
-    return nlp(unicode(a)).similarity(b)
+    seeds = []
+    thresholds = []
+    starts = []
+    for name, phrases, threshold in categories:
+        starts.append(len(seeds))
+        seeds.extend(nlp(unicode(p)).vector for p in phrases)
+        thresholds.extend([threshold] * len(phrases))
+    seeds = unit_rows(np.array(seeds, dtype=np.float32)).T
+    thresholds = np.array(thresholds, dtype=np.float32)
+    groups = {name: set() for name, phrases, threshold in categories}
+
+    def assign(words):
+        if not words:
+            return
+        similarity = np.dot(unit_rows(np.array([w.vector for w in words])), seeds)
+        # One column per category: similar enough to any of its seeds.
+        members = np.logical_or.reduceat(similarity >= thresholds, starts, axis=1)
+        for c, (name, phrases, threshold) in enumerate(categories):
+            groups[name].update(words[i] for i in np.flatnonzero(members[:, c]))
 
-def sim_to_list(w1, other_words, threshold):
+    chunk = []
+    for w in vocabulary:
+        if w.has_vector:
+            chunk.append(w)
+            if len(chunk) == chunk_size:
+                assign(chunk)
+                chunk = []
+    assign(chunk)
+    return groups
+
+
+def group_with_index(index, categories, probes=None):
     '''
-    Checks if a word is similar
-    within a certain threshold of all other
-    words in a given list.
-    :param w1: Word to check against list.
-    :param other_words: List to check word against.
-    :param threshold: How similar w1 must be to any
-                      of the words in other_words.
-    :return: True if sim(w1, w_x) >= threshold for any w_x in
-             other_words, else False.
+    Like group_vocabulary, but asks a VectorIndex for the words
+    within each seed's threshold instead of scanning every word.
+
+    :param index: VectorIndex over the vocabulary.
+    :param categories: List of (name, seed phrases, threshold).
+    :param probes: Index clusters searched per seed, or None for
+                   all, which finds exactly the words of
+                   group_vocabulary.
+    :return: Dictionary of category names to sets of lexemes.
     '''
-    for w2 in other_words:
-        if sim(w2, w1) >= threshold: return True
+    groups = {}
+    for name, phrases, threshold in categories:
+        words = set()
+        for p in phrases:
+            words.update(k for k, similarity in index.radius(nlp(unicode(p)).vector, threshold, probes))
+        groups[name] = set(vocabulary[k] for k in words)
+    return groups
+
+parser = OptionParser()
+parser.add_option('--index', dest='index', action='store_true',
+                  help='Search the vector index in ' + INDEX_DIRECTORY + '.')
+parser.add_option('--probes', type='int', dest='probes',
+                  help='Index clusters searched per seed (approximate).')
+(opts, args_) = parser.parse_args()
+if opts.probes is not None and not opts.index:
+    parser.error('--probes needs --index.')
 
-# Generate the 9 vocabulary lists that will be classified per section.
 # Data to be used in training learning model later on.
-vocab_data = {}
-
-greeting = set([w for w in vocabulary
-                 if sim_to_list(w, ["hello", "goodbye", "greetings", "hey there!", "hi"], 0.75)])
-self = set([w for w in vocabulary
-            if sim_to_list(w, ["me", "I", "my", "our", "this"], 0.8)])
-uncertain = set([w for w in vocabulary
-                 if sim_to_list(w, grouped_tags['uncertain'], 0.75)])
-disagree = set([w for w in vocabulary
-                if sim_to_list(w, ["no", "not", "nah", "never", "definitely not", "no, thanks"], 0.75)])
-other = set([w for w in vocabulary
-             if sim_to_list(w, ["you", "your", "that", "their"], 0.8)])
-tell = set([w for w in vocabulary
-             if sim_to_list(w, grouped_tags['tell'], 0.75)])
-ask = set([w for w in vocabulary
-             if sim_to_list(w, grouped_tags['ask'], 0.6)])
-agree = set([w for w in vocabulary
-             if sim_to_list(w, grouped_tags['agree'], 0.73)])
-good = set([w for w in vocabulary
-            if sim_to_list(w, grouped_tags['good'] + ['excited'], 0.73)])
-
-vocab_data['agree'] = agree
-vocab_data['greeting'] = greeting
-vocab_data['good'] = good
-vocab_data['self'] = self
-vocab_data['uncertain'] = uncertain
-vocab_data['disagree'] = disagree
-vocab_data['other'] = other
-vocab_data['tell'] = tell
-vocab_data['ask'] = ask
+if opts.index:
+    vocab_data = group_with_index(VectorIndex.load(INDEX_DIRECTORY), CATEGORIES, opts.probes)
+else:
+    vocab_data = group_vocabulary(CATEGORIES)
 
 with open('../pickles/vocab_data.pickle', 'wb') as handle:
     pickle.dump(vocab_data, handle, protocol=pickle.HIGHEST_PROTOCOL)
@@ -82,3 +129,7 @@ model.fit(train_x, train_labels)
 
 with open('../pickles/perceptron.pickle', 'wb') as handle:
     pickle.dump(model, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+# The NumPy-only copy predict_and_speak loads (see mlp_inference.py).
+from mlp_inference import export_mlp
+export_mlp(model, '../pickles/perceptron.npz')
@@ -0,0 +1,196 @@
+'''
+Latency benchmarks for the text-to-gesture path and for
+GestureSuite.move.
+
+Text stages follow predict_and_speak.process_input: spaCy
+vectorization, MLP prediction (in batches of batch_size),
+gesture selection, and the whole path end to end, one message
+at a time and through process_batch. Gesture
+stages time segment generation and one scheduled segment per
+GestureSuite.move call, on the robot or, with --standin, on
+the local NAOqi stand-in. Every stage reports p50/p95/p99
+latency and throughput, and results can be written as JSON
+and compared against an earlier run to catch regressions.
+
+Run from this directory, e.g.
+
+    python latency_benchmark.py --corpus-size 2000 --output results.json
+    python latency_benchmark.py --baseline results.json --tolerance 0.15
+'''
+import os
+import re
+import sys
+import json
+import pickle
+import platform
+import numpy as np
+from time import time
+from optparse import OptionParser
+
+ANNOTATION = re.compile(r'\^\w+\([^)]*\)')
+
+
+def summarize(latencies, items=None):
+    '''
+    Summarizes a list of call latencies.
+
+    :param latencies: Seconds taken by each call.
+    :param items: Number of items processed over all calls,
+                  if calls handle more than one item each.
+    :return: Dictionary of calls, mean/p50/p95/p99 latency in
+             milliseconds and throughput in items per second.
+    '''
+    latencies = np.asarray(latencies, dtype=float)
+    items = len(latencies) if items is None else items
+    total = latencies.sum()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else (0, 0, 0)
+    return {'calls': len(latencies), 'items': items,
+            'mean_ms': float(latencies.mean() * 1000) if len(latencies) else 0.0,
+            'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'throughput_per_s': float(items / total) if total else 0.0}
+
+
+def time_calls(function, inputs):
+    '''
+    :param function: Function of one argument to time.
+    :param inputs: Arguments to call it with, one call each.
+    :return: Tuple (latencies, results).
+    '''
+    latencies = []
+    results = []
+    for x in inputs:
+        start = time()
+        results.append(function(x))
+        latencies.append(time() - start)
+    return latencies, results
+
+
+def load_corpus(size):
+    '''
+    Builds a benchmark corpus of plain sentences from the saved
+    messages and the speech corpus, repeated up to size.
+
+    :param size: Number of sentences wanted.
+    :return: List of sentences.
+    '''
+    messages = pickle.load(open('../pickles/messages.pickle', 'rb'))
+    sentences = [' '.join(ANNOTATION.sub(' ', m).split()) for m in messages]
+    for group in pickle.load(open('../pickles/speech_corpus', 'rb')).values():
+        sentences.extend(group)
+    return [sentences[i % len(sentences)] for i in range(size)]
+
+
+def benchmark_text(corpus, batch_size=1):
+    '''
+    Times every stage of predict_and_speak.process_input.
+
+    :param corpus: Sentences to classify.
+    :param batch_size: Rows per model.predict call.
+    :return: Dictionary of stage names to summaries.
+    '''
+    import predict_and_speak as pas
+    # Warm up the pipeline so one-off initialization is not timed.
+    pas.process_input(corpus[0])
+
+    vectorize, vectors = time_calls(pas.vectorize, corpus)
+    batches = [np.vstack(vectors[i:i + batch_size])
+               for i in range(0, len(vectors), batch_size)]
+    predict, predictions = time_calls(pas.resource('model').predict, batches)
+    predictions = np.concatenate(predictions)
+    select, _ = time_calls(lambda pair: pas.annotate(*pair), zip(corpus, predictions))
+    total, _ = time_calls(pas.process_input, corpus)
+    batches = [corpus[i:i + batch_size] for i in range(0, len(corpus), batch_size)]
+    batch, _ = time_calls(lambda texts: pas.process_batch(texts, batch_size), batches)
+    return {'text.vectorize': summarize(vectorize),
+            'text.predict': dict(summarize(predict, len(corpus)), batch_size=batch_size),
+            'text.select': summarize(select),
+            'text.process_input': summarize(total),
+            'text.process_batch': dict(summarize(batch, len(corpus)), batch_size=batch_size)}
+
+
+def benchmark_gestures(segments, directory='../pickles/gesture_data/', robot_ip='127.0.0.1'):
+    '''
+    Times gesture segment generation and single-segment
+    GestureSuite.move calls for every installed category.
+
+    :param segments: Number of segments to time per stage.
+    :param directory: Directory of gesture data.
+    :param robot_ip: NAO's IP, in string format.
+    :return: Dictionary of stage names to summaries.
+    '''
+    sys.path.append('..')
+    from gesture_suite import GestureSuite
+    suite = GestureSuite(directory, robot_ip)
+    categories = sorted(suite.paths)
+    categories = [categories[i % len(categories)] for i in range(segments)]
+    modules = [suite.module(c) for c in categories]
+    generate, _ = time_calls(lambda m: m.analyzer.segment(), modules)
+    move, _ = time_calls(lambda c: suite.move([(c, suite.module(c).time)]), categories)
+    # Time spent beyond the segment's own duration.
+    scale = float(os.environ.get('NAOQI_STANDIN_TIME_SCALE', 1.0)) \
+        if os.environ.get('NAOQI_STANDIN') else 1.0
+    overhead = [t - m.time * scale for t, m in zip(move, modules)]
+    return {'gesture.segment': summarize(generate),
+            'gesture.move': summarize(move),
+            'gesture.overhead': summarize(overhead)}
+
+
+def regressions(baseline, results, tolerance):
+    '''
+    Compares two benchmark results.
+
+    :param baseline: Results of an earlier run.
+    :param results: Results of this run.
+    :param tolerance: Allowed relative increase in p95 latency.
+    :return: List of (stage, baseline p95, current p95) that regressed.
+    '''
+    slower = []
+    for stage, summary in sorted(results['stages'].items()):
+        before = baseline['stages'].get(stage)
+        if before and summary['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            slower.append((stage, before['p95_ms'], summary['p95_ms']))
+    return slower
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--corpus-size', type='int', dest='corpus_size', help='Sentences to classify.')
+    parser.add_option('--batch-size', type='int', dest='batch_size', help='Rows per predict call.')
+    parser.add_option('--segments', type='int', dest='segments', help='Gesture segments to time.')
+    parser.add_option('--skip-text', action='store_true', dest='skip_text')
+    parser.add_option('--skip-gestures', action='store_true', dest='skip_gestures')
+    parser.add_option('--standin', action='store_true', dest='standin',
+                      help='Move the local NAOqi stand-in instead of a robot.')
+    parser.add_option('--ip', dest='ip', help='NAO\'s IP address.')
+    parser.add_option('--output', dest='output', help='File to write JSON results to.')
+    parser.add_option('--baseline', dest='baseline', help='Earlier JSON results to compare with.')
+    parser.add_option('--tolerance', type='float', dest='tolerance',
+                      help='Allowed relative p95 increase over the baseline.')
+    parser.set_defaults(corpus_size=1000, batch_size=1, segments=50, ip='127.0.0.1', tolerance=0.1)
+    (opts, args_) = parser.parse_args()
+    if opts.standin:
+        os.environ['NAOQI_STANDIN'] = '1'
+
+    results = {'created': time(), 'python': platform.python_version(),
+               'machine': platform.machine(), 'parameters': vars(opts), 'stages': {}}
+    if not opts.skip_text:
+        results['stages'].update(benchmark_text(load_corpus(opts.corpus_size), opts.batch_size))
+    if not opts.skip_gestures:
+        results['stages'].update(benchmark_gestures(opts.segments, robot_ip=opts.ip))
+
+    print '%-20s %8s %10s %10s %10s %12s' % ('STAGE', 'CALLS', 'P50 (ms)', 'P95 (ms)', 'P99 (ms)', 'ITEMS/S')
+    for stage, s in sorted(results['stages'].items()):
+        print '%-20s %8d %10.3f %10.3f %10.3f %12.1f' % (
+            stage, s['calls'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['throughput_per_s'])
+    if opts.output:
+        json.dump(results, open(opts.output, 'w'), indent=2, sort_keys=True)
+    if opts.baseline:
+        slower = regressions(json.load(open(opts.baseline)), results, opts.tolerance)
+        for stage, before, after in slower:
+            print 'REGRESSION:', stage, 'p95 went from', before, 'to', after, 'ms'
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
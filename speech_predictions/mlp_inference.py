@@ -0,0 +1,120 @@
+'''
+NumPy-only inference for the gesture category perceptron.
+
+Unpickling the sklearn MLPClassifier imports all of sklearn and
+breaks across sklearn versions. export_mlp writes the trained
+network's weights, biases, activations and class labels to a
+plain .npz file, and MLPPredictor runs the same forward pass
+with NumPy alone, giving the classifier's predictions.
+
+To export the saved model:
+
+    python mlp_inference.py ../pickles/perceptron.pickle ../pickles/perceptron.npz
+'''
+import sys
+import numpy as np
+
+FORMAT = 1
+
+
+def identity(x):
+    return x
+
+
+def logistic(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x):
+    x = np.exp(x - x.max(axis=1)[:, None])
+    return x / x.sum(axis=1)[:, None]
+
+
+ACTIVATIONS = {'identity': identity, 'logistic': logistic, 'tanh': np.tanh,
+               'relu': relu, 'softmax': softmax}
+
+
+def plain_labels(classes):
+    '''
+    :param classes: A classifier's class labels.
+    :return: The labels as an array that loads without pickle:
+             numeric, boolean and string labels keep their
+             dtype, and only object arrays become strings.
+    '''
+    classes = np.asarray(classes)
+    return classes.astype(str) if classes.dtype == object else classes
+
+
+def export_mlp(model, filename):
+    '''
+    Writes a trained MLPClassifier to a .npz file.
+
+    :param model: The fitted MLPClassifier, single-label.
+    :param filename: File to write to.
+    '''
+    if model.out_activation_ not in ('softmax', 'logistic') or \
+            getattr(model, '_label_binarizer', None) is not None and \
+            model._label_binarizer.y_type_ == 'multilabel-indicator':
+        raise ValueError('Only single-label classifiers can be exported.')
+    arrays = {'format': np.array(FORMAT),
+              'activation': np.array(model.activation),
+              'out_activation': np.array(model.out_activation_),
+              'classes': plain_labels(model.classes_),
+              'layers': np.array(len(model.coefs_))}
+    for i, (w, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+        arrays['coef_%d' % i] = w
+        arrays['intercept_%d' % i] = b
+    np.savez(filename, **arrays)
+
+
+class MLPPredictor():
+    """
+    Forward pass of an exported MLPClassifier.
+    """
+
+    def __init__(self, filename):
+        """
+        :param filename: File written by export_mlp.
+        """
+        with np.load(filename) as data:
+            if int(data['format']) != FORMAT:
+                raise ValueError('Unknown model format in ' + filename)
+            layers = int(data['layers'])
+            self.coefs = [data['coef_%d' % i] for i in range(layers)]
+            self.intercepts = [data['intercept_%d' % i] for i in range(layers)]
+            self.activation = str(data['activation'])
+            self.out_activation = str(data['out_activation'])
+            self.classes_ = data['classes']
+
+    def predict_proba(self, x):
+        '''
+        :param x: Matrix of samples, one per row.
+        :return: Matrix of class probabilities, one column per
+                 class of classes_.
+        '''
+        x = np.atleast_2d(np.asarray(x, dtype=self.coefs[0].dtype))
+        hidden = ACTIVATIONS[self.activation]
+        last = len(self.coefs) - 1
+        for i, (w, b) in enumerate(zip(self.coefs, self.intercepts)):
+            x = np.dot(x, w) + b
+            x = hidden(x) if i < last else ACTIVATIONS[self.out_activation](x)
+        if self.out_activation == 'logistic':
+            # Binary: one output, the probability of the second class.
+            x = np.hstack([1 - x, x])
+        return x
+
+    def predict(self, x):
+        '''
+        :param x: Matrix of samples, one per row.
+        :return: Array of predicted classes.
+        '''
+        return self.classes_[np.argmax(self.predict_proba(x), axis=1)]
+
+
+if __name__ == '__main__':
+    import pickle
+    export_mlp(pickle.load(open(sys.argv[1], 'rb')), sys.argv[2])
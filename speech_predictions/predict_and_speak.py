@@ -1,15 +1,85 @@
+import os
+import sys
 import pickle
-import spacy
+import threading
+import numpy as np
 import read_animations
-import en_vectors_glove_md as eng
 from read_animations import start, wait
-from random import randint
-from subprocess import call
+from subprocess import Popen
+from speech_bridge import BridgeServer
 
-nlp = eng.load()
-model = pickle.load(open('../pickles/perceptron.pickle', 'rb'))
-all_animations_grouped = pickle.load(
-    open('../pickles/all_animations_grouped.pickle', 'rb'))
+# Heavy resources load lazily, on first use or in the background
+# through preload(), so that the prompt comes up immediately.
+# A pruned vector table, if built and checked to match spaCy (see
+# vector_table.py), stands in for the full spaCy model when
+# embedding text, and an exported perceptron (see mlp_inference.py)
+# for the sklearn pickle, unless the pickle is newer.
+VECTOR_TABLE = '../pickles/vector_table'
+MODEL = '../pickles/perceptron.npz'
+PICKLED_MODEL = '../pickles/perceptron.pickle'
+resources = {}
+loading = threading.Lock()
+
+
+def resource(name):
+    '''
+    Returns a heavy resource, loading it on first use.
+
+    :param name: 'embed' or 'model'.
+    :return: For 'embed', an object with embed(text) and
+             embed_many(texts, batch_size) methods; for 'model',
+             the trained classifier.
+    '''
+    if name not in resources:
+        with loading:
+            if name not in resources:
+                resources[name] = load_resource(name)
+    return resources[name]
+
+
+class SpacyEmbedder():
+    """
+    Embeds text with the full spaCy model.
+    """
+
+    def __init__(self):
+        import en_vectors_glove_md as eng
+        self.nlp = eng.load()
+
+    def embed(self, text):
+        return self.nlp(unicode(text)).vector
+
+    def embed_many(self, texts, batch_size=1000):
+        # spaCy's pipe streams the texts through the pipeline in batches.
+        docs = self.nlp.pipe((unicode(t) for t in texts), batch_size=batch_size)
+        return np.array([d.vector for d in docs])
+
+
+def load_resource(name):
+    if name == 'embed':
+        if os.path.isdir(VECTOR_TABLE):
+            from vector_table import VectorTable
+            table = VectorTable(VECTOR_TABLE)
+            if table.verified:
+                return table
+        return SpacyEmbedder()
+    if name == 'model':
+        # An export older than the pickle is stale: the model was retrained.
+        if os.path.exists(MODEL) and not (os.path.exists(PICKLED_MODEL) and
+                                          os.path.getmtime(PICKLED_MODEL) > os.path.getmtime(MODEL)):
+            from mlp_inference import MLPPredictor
+            return MLPPredictor(MODEL)
+        return pickle.load(open(PICKLED_MODEL, 'rb'))
+    raise ValueError('Unknown resource: ' + name)
+
+
+def preload():
+    '''
+    Loads every heavy resource on a background thread.
+    '''
+    worker = threading.Thread(target=lambda: [resource(n) for n in ('model', 'embed')])
+    worker.daemon = True
+    worker.start()
 
 
 def blank():
@@ -30,10 +100,30 @@ def process_gesture(category):
     :return: A random animation fitting the appropriate
              category, ensuring "natural", stochastic output.
     '''
-    group = read_animations.grouped_tags[category]
-    animations = read_animations.animations_by_tag[
-        group[randint(0, len(group) - 1)]]
-    return animations[randint(0, len(animations) - 1)]
+    return read_animations.catalog.choose(category)
+
+
+def vectorize(text):
+    '''
+    Embeds text with the spaCy model.
+
+    :param text: Text to be said.
+    :return: The text's vector as a single-row matrix.
+    '''
+    return resource('embed').embed(text).reshape(1, -1)
+
+
+def annotate(text, prediction):
+    '''
+    Picks a gesture from a predicted category and wraps
+    the text in an ALAnimatedSpeech command for it.
+
+    :param text: Text to be said.
+    :param prediction: Category predicted by the model.
+    :return: ALAnimatedSpeech command form of text.
+    '''
+    gesture = read_animations.catalog.choose_path(prediction)
+    return start(gesture) + ' ' + text + ' ' + wait(gesture)
 
 
 def process_input(input):
@@ -46,15 +136,34 @@ def process_input(input):
     :param input: Text to be said.
     :return: ALAnimatedSpeech command form of input.
     '''
-    prediction = model.predict(nlp(unicode(input)).vector.reshape(1, -1))
-    prediction_string = prediction[0]
-    # 0th index is gesture tag.
-    category = all_animations_grouped[prediction_string]
-    gesture = category[randint(0, len(category) - 1)]
-    return start(gesture) + ' ' + input + ' ' + wait(gesture)
+    return annotate(input, resource('model').predict(vectorize(input))[0])
+
+
+def process_batch(messages, batch_size=1000, send=None):
+    '''
+    Classifies many messages at once: each batch is embedded
+    in one streaming pass and predicted in one matrix call.
+
+    :param messages: List of texts to be said.
+    :param batch_size: Messages embedded and predicted together.
+    :param send: Optional function called with every command
+                 as soon as its batch is classified.
+    :return: List of ALAnimatedSpeech commands, in input order.
+    '''
+    embedder = resource('embed')
+    model = resource('model')
+    commands = []
+    for i in range(0, len(messages), batch_size):
+        batch = messages[i:i + batch_size]
+        predictions = model.predict(embedder.embed_many(batch, batch_size))
+        for text, p in zip(batch, predictions):
+            commands.append(annotate(text, p))
+            if send:
+                send(commands[-1])
+    return commands
 
 
-def prompt():
+def prompt(send=None):
     '''
     A user interface (through console) that queries the
     client for messages for NAO to say. Queries are
@@ -62,6 +171,8 @@ def prompt():
     emoted by one gesture from Aldebaran's standard library
     of animations (start to end).
 
+    :param send: Optional function called with every message
+                 as soon as it is classified.
     :return: The messages that the user has typed, each
              in ALAnimatedSpeech command form.
     '''
@@ -75,11 +186,35 @@ def prompt():
             blank()
             break
         messages.append(process_input(input))
+        if send:
+            send(messages[-1])
     return messages
 
-# Dump the messages to disk & call subprocess for NAO to speak.
-pickle.dump(prompt(), open('../pickles/messages.pickle', 'wb'))
-blank()
-print 'Saved messages to disk. Speaking now...\n'
+if __name__ == '__main__':
+    preload()
+    # Start the speech runner (32-bit Python) and stream every
+    # message to it as soon as it is classified.
+    bridge = BridgeServer()
+    runner = Popen(['python', 'speech_runner.py', '--bridge', str(bridge.port)])
+    messages = []
+
+    def send(message):
+        # Recorded before sending, so it is kept if the runner is gone.
+        messages.append(message)
+        bridge.send(message)
 
-call(['python', 'speech_runner.py'])
+    try:
+        bridge.accept(timeout=60)
+        if len(sys.argv) > 1:
+            # Scripted session: classify every line of a file.
+            with open(sys.argv[1]) as f:
+                process_batch([l.strip() for l in f if l.strip()], send=send)
+        else:
+            prompt(send)
+    finally:
+        # Keep a record of the session on disk, however it ended.
+        if messages:
+            pickle.dump(messages, open('../pickles/messages.pickle', 'wb'))
+        bridge.close()
+    print 'Sent', bridge.sent, 'messages. Waiting for NAO to finish speaking...\n'
+    runner.wait()
@@ -5,36 +5,191 @@ and list objects that depend on each other.
 This information is used in other modules that
 require learning and adaptive string formulation
 for NAO behavior.
+
+The parsed CSVs and indexes over them are kept in an
+AnimationCatalog. Importing this module loads the catalog
+from its binary cache if the cache is current, and parses
+the CSVs otherwise; it never writes the cache. To build the
+cache after the CSVs change, run from this directory
+
+    python read_animations.py
 '''
+import os
+import csv
+import pickle
+from random import random
 
 folder = '../animation_info/'
+CACHE = '../pickles/animation_catalog.cache'
+GROUPED = '../pickles/all_animations_grouped.pickle'
+CACHE_VERSION = 3
+SOURCES = ('nao_animations.csv', 'nao_animations_tagged.csv', 'grouped_tags.csv')
+
+
+def read_rows(filename):
+    '''
+    :return: Rows of a CSV file, its header omitted.
+    '''
+    # Universal newlines: grouped_tags.csv ends its lines with CR only.
+    with open(filename, 'rU') as f:
+        return [row for row in csv.reader(f)][1:]
+
+
+def posture(path):
+    '''
+    :param path: Full behavior path, e.g. animations/Stand/Gestures/Yes_1.
+    :return: The posture it is played from, e.g. 'Stand'.
+    '''
+    parts = path.split('/')
+    return parts[1] if len(parts) > 2 else ''
+
+
+class AnimationCatalog():
+    """
+    NAO's animations, their tags and the nine groups of tags,
+    with indexes from group to tag to animation, from animation
+    to behavior path, from posture to behavior paths and from
+    group to the behavior paths spoken messages are annotated with.
+    """
 
-# Get animation dictionary for full-name reference.
-with open(folder + 'nao_animations.csv') as f:
-    animations = f.readlines()[1:]
-animations = [tuple(a.split(',')[:-1]) for a in animations]
-# Dictionary of gestures and their full names,
-# where keys are gesture names and values are NAO directory references.
-animations_dict = {t[0]:t[1] for t in animations}
-
-# Get animations keyed by tags.
-with open(folder + 'nao_animations_tagged.csv') as f:
-    # Omit the first row, which contains the column headers.
-    tagged_animations = f.readlines()[1:]
-# Break lines into tags and their corresponding gestures.
-tagged_animations = [a.split(',') for a in tagged_animations]
-animations_by_tag = {a[0]:[w.strip() for w in a[1].split(';')] for a in tagged_animations}
-
-# Get grouped tags for later machine learning.
-# 9 classes to learn:
-# 'good', 'uncertain', 'self', 'disagree',
-# 'greeting', 'tell', 'other', 'ask', 'agree'
-with open(folder + 'grouped_tags.csv', 'rU') as f:
-    lines = f.readlines()[1:]
-    lines = [l.strip().split(',') for l in lines]
-grouped_tags = {group:[] for group in [l[1] for l in lines]}
-for l in lines:
-    grouped_tags[l[1]].append(l[0])
+    def __init__(self, animations, animations_by_tag, grouped_tags, grouped_paths=None):
+        """
+        :param animations: List of (name, full behavior path).
+        :param animations_by_tag: Dictionary of tags to animation names.
+        :param grouped_tags: Dictionary of groups to their tags.
+        :param grouped_paths: Dictionary of groups to lists of full
+                              behavior paths, as in
+                              all_animations_grouped.pickle.
+        """
+        self.animations = animations
+        self.animations_by_tag = animations_by_tag
+        self.grouped_tags = grouped_tags
+        # Gestures keyed by name; a name played from several
+        # postures keeps its last path, as it always has.
+        self.animations_dict = {name: path for name, path in animations}
+        self.paths = {(name, posture(path)): path for name, path in animations}
+        self.by_posture = {}
+        for name, path in animations:
+            self.by_posture.setdefault(posture(path), []).append(path)
+        self.group_index = {group: {tag: animations_by_tag[tag] for tag in tags}
+                            for group, tags in grouped_tags.items()}
+        # Per group, a tuple of every tag's animations, for selection
+        # by index without building anything.
+        self.choices = {group: tuple(tuple(animations_by_tag[tag]) for tag in tags)
+                        for group, tags in grouped_tags.items()}
+        # Likewise per group, every behavior path; paths listed
+        # more than once are picked proportionally more often.
+        self.grouped_paths = {str(group): tuple(paths)
+                              for group, paths in (grouped_paths or {}).items()}
+
+    @classmethod
+    def parse(cls, folder=folder, grouped=GROUPED):
+        """
+        Parses the animation CSVs.
+
+        :param folder: Directory of the CSVs.
+        :param grouped: Pickle of groups to behavior paths, read
+                        if it exists, or None.
+        :return: The AnimationCatalog.
+        """
+        # Dictionary of gestures and their full names,
+        # where keys are gesture names and values are NAO directory references.
+        animations = [tuple(row[:-1]) for row in read_rows(folder + 'nao_animations.csv')]
+        # Tags and their corresponding gestures.
+        animations_by_tag = {row[0]: [w.strip() for w in row[1].split(';')]
+                             for row in read_rows(folder + 'nao_animations_tagged.csv')}
+        # Grouped tags for later machine learning.
+        # 9 classes to learn:
+        # 'good', 'uncertain', 'self', 'disagree',
+        # 'greeting', 'tell', 'other', 'ask', 'agree'
+        grouped_tags = {}
+        for tag, group in read_rows(folder + 'grouped_tags.csv'):
+            grouped_tags.setdefault(group, []).append(tag)
+        grouped_paths = None
+        if grouped and os.path.exists(grouped):
+            with open(grouped, 'rb') as f:
+                grouped_paths = pickle.load(f)
+        return cls(animations, animations_by_tag, grouped_tags, grouped_paths)
+
+    @classmethod
+    def load(cls, folder=folder, cache=CACHE, write=False, grouped=GROUPED):
+        """
+        Loads the catalog from its cache, parsing the CSVs
+        if the cache is missing or any of them changed.
+
+        :param folder: Directory of the CSVs.
+        :param cache: Cache file, or None to always parse.
+        :param write: Whether to rewrite an outdated cache.
+        :param grouped: Pickle of groups to behavior paths, or None.
+        :return: The AnimationCatalog.
+        """
+        mtimes = [os.path.getmtime(folder + name) for name in SOURCES]
+        mtimes.append(os.path.getmtime(grouped) if grouped and os.path.exists(grouped) else None)
+        if cache and os.path.exists(cache):
+            # The cache holds plain lists and dictionaries only, so
+            # it loads whichever module wrote it.
+            try:
+                with open(cache, 'rb') as f:
+                    version, cached_mtimes, data = pickle.load(f)
+            except (EOFError, ValueError, pickle.UnpicklingError):
+                version = None  # Truncated or corrupt: parse the CSVs.
+            except (AttributeError, ImportError):
+                version = None  # Written by an older version of this module.
+            if version == CACHE_VERSION and cached_mtimes == mtimes:
+                return cls(*data)
+        catalog = cls.parse(folder, grouped)
+        if cache and write:
+            data = (catalog.animations, catalog.animations_by_tag, catalog.grouped_tags,
+                    catalog.grouped_paths)
+            temporary = cache + '.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump((CACHE_VERSION, mtimes, data), f, pickle.HIGHEST_PROTOCOL)
+            if os.name == 'nt' and os.path.exists(cache):
+                os.remove(cache)
+            os.rename(temporary, cache)
+        return catalog
+
+    def path(self, name, posture=None):
+        """
+        :param name: Animation name, e.g. Yes_1.
+        :param posture: Posture to play it from, e.g. 'Sit';
+                        if None, the path of animations_dict.
+        :return: Full behavior path of the animation.
+        """
+        if posture is None:
+            return self.animations_dict[name]
+        return self.paths[(name, posture)]
+
+    def choose(self, group):
+        """
+        Picks a random tag of a group, then a random
+        animation of that tag.
+
+        :param group: One of the nine groups.
+        :return: Name of the animation.
+        """
+        tags = self.choices[group]
+        animations = tags[int(random() * len(tags))]
+        return animations[int(random() * len(animations))]
+
+    def choose_path(self, group):
+        """
+        Picks a random behavior path of a group, uniformly
+        from its list in all_animations_grouped.pickle.
+
+        :param group: One of the nine groups.
+        :return: Full behavior path of the animation, e.g.
+                 animations/Stand/Gestures/Me_2.
+        """
+        paths = self.grouped_paths[group]
+        return paths[int(random() * len(paths))]
+
+
+catalog = AnimationCatalog.load()
+animations = catalog.animations
+animations_dict = catalog.animations_dict
+animations_by_tag = catalog.animations_by_tag
+grouped_tags = catalog.grouped_tags
 
 def run(animation):
     '''
@@ -68,3 +223,7 @@ def wait(animation):
     :return: String representation of NAO command.
     '''
     return "^wait(" + animation + ")"
+
+if __name__ == '__main__':
+    catalog = AnimationCatalog.load(write=True)
+    print 'Cached', len(catalog.animations), 'animations in', CACHE
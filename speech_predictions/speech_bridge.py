@@ -0,0 +1,122 @@
+'''
+Streams messages from the classifier process to the speech
+runner over a local TCP socket.
+
+The classifier runs in 64-bit Python (spaCy, sklearn) and
+NAO's SDK only in 32-bit Python, so the two cannot share a
+process. The classifier listens on a loopback port, starts
+the speech runner with that port, and sends every message
+the moment it has been classified.
+
+Each message is one frame: its length as a 4-byte big-endian
+unsigned integer followed by its UTF-8 bytes. Closing the
+connection ends the session.
+'''
+import socket
+import struct
+
+HOST = '127.0.0.1'
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock, text):
+    '''
+    :param sock: Connected socket.
+    :param text: Message to send, str or unicode.
+    '''
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    sock.sendall(HEADER.pack(len(text)) + text)
+
+
+def receive_exactly(sock, size):
+    '''
+    :return: The next size bytes from sock, or None if the
+             connection closed first.
+    '''
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(sock):
+    '''
+    :param sock: Connected socket.
+    :return: The next message as a UTF-8 str, or None once
+             the session has ended.
+    '''
+    header = receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size, = HEADER.unpack(header)
+    return receive_exactly(sock, size)
+
+
+class BridgeServer():
+    """
+    The classifier's end of the bridge: listens on a free
+    loopback port and sends messages to the one runner that
+    connects.
+    """
+
+    def __init__(self, host=HOST, port=0):
+        """
+        :param host: Interface to listen on.
+        :param port: Port to listen on, 0 for any free one.
+        """
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind((host, port))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.connection = None
+        self.sent = 0
+
+    def accept(self, timeout=None):
+        '''
+        Waits for the speech runner to connect.
+
+        :param timeout: Seconds to wait, or None to wait forever.
+        '''
+        self.listener.settimeout(timeout)
+        self.connection, _ = self.listener.accept()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.listener.close()
+
+    def send(self, text):
+        send_message(self.connection, text)
+        self.sent += 1
+
+    def close(self):
+        '''
+        Ends the session and closes the connection.
+        '''
+        if self.connection is not None:
+            self.connection.shutdown(socket.SHUT_WR)
+            self.connection.close()
+            self.connection = None
+        else:
+            self.listener.close()
+
+
+def messages(port, host=HOST):
+    '''
+    The runner's end of the bridge: connects to the
+    classifier and yields messages as they arrive.
+
+    :param port: Port the classifier listens on.
+    :param host: Host the classifier listens on.
+    '''
+    sock = socket.create_connection((host, port))
+    try:
+        while True:
+            message = receive_message(sock)
+            if message is None:
+                return
+            yield message
+    finally:
+        sock.close()
@@ -4,37 +4,261 @@ Takes messages generated from learning_gestures
 and sends them to NAO over the ALAnimatedSpeech
 module. NAO speaks each message with its annotated
 behaviors.
+
+Messages arrive either live over the speech bridge
+(--bridge PORT, as started by predict_and_speak) or
+from the messages saved on disk. They are said through
+non-blocking post calls, so the next message is ready
+the moment NAO finishes the last one, e.g.
+
+    python speech_runner.py --gap 0.5 --log session.jsonl
+    python speech_runner.py --gap -0.3
 '''
 
-import pickle, time
-from multiprocessing import Process
-from naoqi import ALProxy
+import os, re, sys, json, pickle, time, threading
+from collections import deque
+from optparse import OptionParser
+sys.path.append('..')
+from nao_proxy import proxy
+import speech_bridge
+from gesture_durations import CATALOG, DurationCatalog
 
-def load_and_speak(ip="192.168.0.10", port=9559):
+ANNOTATION = re.compile(r'\^\w+\([^)]*\)')
+
+def spoken_words(message):
+
+    '''
+    :return: Number of words said in message, annotations excluded.
+    '''
+
+    return len(ANNOTATION.sub(' ', message).split())
+
+class SpeechPipeline():
+
+    '''
+    Says messages through post calls, one watcher thread
+    tracking each task. The next message is submitted gap
+    seconds after the current one finishes or, for a
+    negative gap, that many seconds before it is predicted
+    to finish, so NAO's speech queue never runs dry. The
+    prediction is a speaking time per word, learned from
+    the messages said so far, plus the catalogued duration
+    of the message's animations.
+    '''
+
+    def __init__(self, speech, configuration=None, gap=0.0, rate=0.4,
+                 adaptive=True, smoothing=0.3, log=None, catalog=None):
+
+        '''
+        :param speech: ALAnimatedSpeech proxy.
+        :param configuration: Configuration passed to every say.
+        :param gap: Seconds of silence between messages; negative
+                    values submit that many seconds early instead.
+        :param rate: Initial predicted speaking time per word, in seconds.
+        :param adaptive: Whether to learn the rate from finished messages.
+        :param smoothing: Weight of each new measurement in the rate.
+        :param log: Open file to write one JSON record per message to.
+        :param catalog: Optional DurationCatalog of animation durations.
+        '''
+
+        self.speech = speech
+        self.configuration = configuration or {"bodyLanguageMode" : "disabled"}
+        self.gap = gap
+        self.rate = rate
+        self.adaptive = adaptive
+        self.smoothing = smoothing
+        self.log = log
+        self.catalog = catalog
+        self.records = []
+        self.unfinished = deque()
+        self.last_finished = None
+        self.begin = time.time()
+
+    def now(self):
+        return time.time() - self.begin
+
+    def submit(self, message):
+
+        '''
+        Posts a message to NAO without waiting for it.
+
+        :return: The message's record.
+        '''
+
+        entry = {'index': len(self.records) + len(self.unfinished) + 1,
+                 'message': message, 'words': spoken_words(message)}
+        if self.catalog is not None:
+            entry['predicted'] = self.catalog.message_time(message, self.rate)
+        else:
+            entry['predicted'] = self.rate * max(entry['words'], 1)
+        entry['submitted'] = self.now()
+        done = threading.Event()
+        task = self.speech.post.say(message, self.configuration)
+        watcher = threading.Thread(target=self.watch, args=(task, entry, done))
+        watcher.daemon = True
+        watcher.start()
+        self.unfinished.append((entry, done))
+        print '> MESSAGE ' + str(entry['index']) + ':\n  ' + message + '\n'
+        return entry
+
+    def watch(self, task, entry, done):
+        self.speech.wait(task, 0)
+        entry['finished'] = self.now()
+        done.set()
+
+    def finish_oldest(self):
+
+        '''
+        Waits for the oldest unfinished message, then records
+        its timing and updates the predicted rate.
+        '''
+
+        entry, done = self.unfinished.popleft()
+        done.wait()
+        # NAO says queued messages one after another.
+        entry['started'] = entry['submitted'] if self.last_finished is None \
+            else max(entry['submitted'], self.last_finished)
+        entry['silence'] = 0.0 if self.last_finished is None \
+            else max(0.0, entry['submitted'] - self.last_finished)
+        entry['duration'] = entry['finished'] - entry['started']
+        if self.adaptive:
+            self.learn(entry)
+        self.last_finished = entry['finished']
+        self.records.append(entry)
+        print '    Message', entry['index'], 'took', entry['duration'], 'seconds to say.\n'
+        if self.log:
+            self.log.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.log.flush()
+
+    def learn(self, entry):
+
+        '''
+        Updates the predicted rate from a finished message's
+        speaking time, leaving out its catalogued animations.
+        '''
+
+        speaking = entry['duration']
+        if self.catalog is not None:
+            run, waited = self.catalog.animation_times(entry['message'])
+            if speaking <= waited:
+                # The ^wait animation outlasted the speech, so its length is unknown.
+                return
+            speaking = max(0.0, speaking - run)
+        measured = speaking / max(entry['words'], 1)
+        self.rate += self.smoothing * (measured - self.rate)
+
+    def hand_over(self):
+
+        '''
+        Waits until the next message may be submitted.
+        '''
+
+        while len(self.unfinished) > 1:
+            self.finish_oldest()
+        if not self.unfinished:
+            return
+        entry, done = self.unfinished[0]
+        if self.gap >= 0:
+            self.finish_oldest()
+            time.sleep(max(0.0, self.last_finished + self.gap - self.now()))
+        else:
+            start = entry['submitted'] if self.last_finished is None \
+                else max(entry['submitted'], self.last_finished)
+            if done.wait(max(0.0, start + entry['predicted'] + self.gap - self.now())):
+                self.finish_oldest()
+
+    def run(self, messages):
+
+        '''
+        :param messages: Iterable of messages in ALAnimatedSpeech form.
+        :return: List of per-message records, in order.
+        '''
+
+        for message in messages:
+            self.hand_over()
+            self.submit(message)
+        while self.unfinished:
+            self.finish_oldest()
+        return self.records
+
+
+def speak(messages, ip="192.168.0.10", port=9559, gap=0.0, adaptive=True, log=None):
+
+    '''
+    Prompts NAO to speak messages as they come. Time
+    analytics provided at runtime, detailing how long
+    each message takes to say. Gestures are run in
+    disabled body language mode.
+
+    :param messages: Iterable of messages in ALAnimatedSpeech form.
+    :param ip: NAO's current IP, default of 192.168.0.10.
+    :param port: Hosting port for NAO's interface, default of 9559.
+    :param gap: Seconds between messages, see SpeechPipeline.
+    :param adaptive: Whether to learn the speaking rate.
+    :param log: Optional file name to write per-message JSON records to.
+    :return: Number of messages said.
+    '''
+
+    speech = proxy("ALAnimatedSpeech", ip, port)
+    catalog = DurationCatalog() if os.path.exists(CATALOG) else None
+    log = open(log, 'a') if log else None
+    try:
+        pipeline = SpeechPipeline(speech, gap=gap, adaptive=adaptive, log=log, catalog=catalog)
+        records = pipeline.run(messages)
+    finally:
+        if log:
+            log.close()
+    if records:
+        print '    Said', len(records), 'messages in', records[-1]['finished'] - records[0]['submitted'], \
+            'seconds, with', sum(r['silence'] for r in records), 'seconds of silence.\n'
+    return len(records)
+
+def load_and_speak(ip="192.168.0.10", port=9559, **kwargs):
 
     '''
     Loads messages processed from the user and prompts
-    NAO to speak. Time analytics provided at runtime,
-    detailing how long each message takes to say. Gestures
-    are run in disabled body language mode.
+    NAO to speak them.
 
     :param ip: NAO's current IP, default of 192.168.0.10.
     :param port: Hosting port for NAO's interface, default of 9559.
+    :param kwargs: Timing options passed on to speak.
     :return: void
     '''
 
     messages = pickle.load(open('../pickles/messages.pickle'))
-    speech = ALProxy("ALAnimatedSpeech", ROBOT_IP, PORT)
-    configuration = {"bodyLanguageMode" : "disabled"}
-    delay = 2 # Delay in seconds.
     print '\nAMOUNT OF MESSAGES:', len(messages), '\n'
-    for i in range(len(messages)):
-        print '> MESSAGE ' + str(i + 1) + ':\n  ' + messages[i] + '\n'
-        start = time.time()
-        speech.say(messages[i], configuration)
-        total_time = time.time() - start
-        print '    Message', i + 1, 'took', total_time, 'seconds to say.\n'
-        time.sleep(delay) # Wait before saying next message.
+    speak(messages, ip, port, **kwargs)
+
+def bridge_and_speak(bridge_port, ip="192.168.0.10", port=9559, **kwargs):
+
+    '''
+    Speaks messages streamed over the speech bridge,
+    each one as soon as it arrives.
+
+    :param bridge_port: Port predict_and_speak listens on.
+    :param ip: NAO's current IP, default of 192.168.0.10.
+    :param port: Hosting port for NAO's interface, default of 9559.
+    :param kwargs: Timing options passed on to speak.
+    :return: void
+    '''
+
+    count = speak(speech_bridge.messages(bridge_port), ip, port, **kwargs)
+    print '\nAMOUNT OF MESSAGES:', count, '\n'
 
 # Run in command console.
-load_and_speak()
+if __name__ == '__main__':
+    parser = OptionParser()
+    parser.add_option('--bridge', type='int', dest='bridge', help='Speech bridge port to read messages from.')
+    parser.add_option('--ip', dest='ip', help='NAO\'s IP address.')
+    parser.add_option('--gap', type='float', dest='gap',
+                      help='Seconds between messages; negative to overlap.')
+    parser.add_option('--fixed-rate', action='store_false', dest='adaptive',
+                      help='Do not adapt the predicted speaking rate.')
+    parser.add_option('--log', dest='log', help='File to append per-message JSON records to.')
+    parser.set_defaults(ip='192.168.0.10', gap=0.0, adaptive=True)
+    (opts, args_) = parser.parse_args()
+    options = {'gap': opts.gap, 'adaptive': opts.adaptive, 'log': opts.log}
+    if opts.bridge:
+        bridge_and_speak(opts.bridge, opts.ip, **options)
+    else:
+        load_and_speak(opts.ip, **options)
@@ -0,0 +1,177 @@
+'''
+A pruned, memory-mapped table of word vectors.
+
+Loading the full GloVe model to embed a handful of messages
+dominates start-up. A vector table holds only the words we
+need, is memory-mapped on load, and embeds text the way
+spaCy's Doc.vector does: the mean of its tokens' vectors,
+out-of-vocabulary tokens counting as zeros. Words are looked up
+case-sensitively, as spaCy does. Tokenization approximates
+spaCy's English rules (punctuation split off, clitics such as
+"n't" and "'s" kept as their own tokens).
+
+Since the tokenization is approximate, a built table is checked
+against spaCy on the saved corpora: their embeddings and the
+perceptron's predictions from them are compared, and the result
+is saved with the table. Only a table that passed is used in
+place of spaCy.
+
+To build and check one, keeping the 50000 most frequent words
+plus every spoken word of the saved corpora:
+
+    python vector_table.py ../pickles/vector_table 50000
+'''
+import os
+import re
+import sys
+import json
+import heapq
+import numpy as np
+
+REPORT = 'report.json'
+TOLERANCE = 1e-5  # Largest embedding difference a passing table may have.
+ANNOTATION = re.compile(r'\^\w+\([^)]*\)')
+TOKEN = re.compile(r"\w+(?=n't\b)|n't\b|'\w+|\w+|[^\w\s]", re.UNICODE)
+
+
+def tokenize(text):
+    '''
+    :return: List of tokens of text.
+    '''
+    return TOKEN.findall(text)
+
+
+def build_vector_table(vocab, words, directory):
+    '''
+    Saves the vectors of the given words.
+
+    :param vocab: The spaCy Vocab to take vectors from.
+    :param words: Words to keep; those without a vector are skipped.
+    :param directory: Directory to write the table to.
+    '''
+    keys = []
+    vectors = []
+    for w in sorted(set(words)):
+        lexeme = vocab[w]
+        if lexeme.has_vector:
+            keys.append(w)
+            vectors.append(lexeme.vector)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if os.path.exists(os.path.join(directory, REPORT)):
+        # The old check does not apply to the new table.
+        os.remove(os.path.join(directory, REPORT))
+    np.save(os.path.join(directory, 'vectors.npy'), np.array(vectors, dtype=np.float32))
+    with open(os.path.join(directory, 'keys.json'), 'w') as f:
+        json.dump(keys, f)
+
+
+class VectorTable():
+    """
+    Word vectors for a fixed vocabulary, memory-mapped from disk.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Directory the table was built in.
+        """
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        with open(os.path.join(directory, 'keys.json')) as f:
+            self.rows = {k: i for i, k in enumerate(json.load(f))}
+        self.zeros = np.zeros(self.vectors.shape[1], dtype=np.float32)
+        self.report = None
+        if os.path.exists(os.path.join(directory, REPORT)):
+            with open(os.path.join(directory, REPORT)) as f:
+                self.report = json.load(f)
+        # Whether the table was checked to match spaCy.
+        self.verified = bool(self.report and self.report['passed'])
+
+    def __contains__(self, word):
+        return word in self.rows
+
+    def word_vector(self, word):
+        '''
+        :return: The vector of word, or zeros if it is not in the table.
+        '''
+        row = self.rows.get(word)
+        return self.zeros if row is None else self.vectors[row]
+
+    def embed(self, text):
+        '''
+        :return: The mean vector of text's tokens.
+        '''
+        tokens = tokenize(text)
+        if not tokens:
+            return self.zeros.copy()
+        return np.mean([self.word_vector(t) for t in tokens], axis=0)
+
+    def embed_many(self, texts, batch_size=None):
+        '''
+        :return: Matrix of the mean vectors of texts, one row each.
+        '''
+        return np.array([self.embed(t) for t in texts]).reshape(len(texts), self.vectors.shape[1])
+
+
+def frequent_words(vocab, limit):
+    '''
+    :param vocab: The spaCy Vocab.
+    :param limit: Number of words wanted.
+    :return: The limit most frequent words with a vector, ranked
+             by their lexemes' log probabilities.
+    '''
+    lexemes = heapq.nlargest(limit, (w for w in vocab if w.has_vector), key=lambda w: w.prob)
+    return [w.orth_ for w in lexemes]
+
+
+def check_vector_table(table, texts, expected, model=None, tolerance=TOLERANCE):
+    '''
+    Compares a table's embeddings of texts with spaCy's.
+
+    :param table: The VectorTable.
+    :param texts: Texts to embed.
+    :param expected: Matrix of spaCy's vectors of texts, one row each.
+    :param model: Classifier whose predictions from both
+                  embeddings are compared, or None.
+    :param tolerance: Largest embedding difference allowed.
+    :return: Dictionary of the number of texts, the largest
+             absolute embedding difference, the number of texts
+             predicted differently and whether the table passed.
+    '''
+    embedded = table.embed_many(texts)
+    expected = np.asarray(expected, dtype=np.float32).reshape(embedded.shape)
+    difference = float(np.abs(embedded - expected).max()) if len(texts) else 0.0
+    mispredicted = 0
+    if model is not None and len(texts):
+        mispredicted = int(np.sum(model.predict(embedded) != model.predict(expected)))
+    return {'texts': len(texts), 'difference': difference, 'mispredicted': mispredicted,
+            'passed': difference <= tolerance and mispredicted == 0}
+
+
+if __name__ == '__main__':
+    import pickle
+    import en_vectors_glove_md as spacy_model
+    nlp = spacy_model.load()
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    words = frequent_words(nlp.vocab, limit)
+    # Only the spoken text of saved messages, without their annotations.
+    messages = [' '.join(ANNOTATION.sub(' ', m).split())
+                for m in pickle.load(open('../pickles/messages.pickle', 'rb'))]
+    for group in pickle.load(open('../pickles/speech_corpus', 'rb')).values():
+        messages.extend(group)
+    messages = [unicode(m) for m in messages]
+    for m in messages:
+        words.extend(tokenize(m))
+    build_vector_table(nlp.vocab, words, sys.argv[1])
+
+    if os.path.exists('../pickles/perceptron.npz'):
+        from mlp_inference import MLPPredictor
+        model = MLPPredictor('../pickles/perceptron.npz')
+    else:
+        model = pickle.load(open('../pickles/perceptron.pickle', 'rb'))
+    expected = np.array([d.vector for d in nlp.pipe(messages, batch_size=1000)])
+    report = check_vector_table(VectorTable(sys.argv[1]), messages, expected, model)
+    with open(os.path.join(sys.argv[1], REPORT), 'w') as f:
+        json.dump(report, f)
+    print 'Largest embedding difference %(difference)g, %(mispredicted)d of ' \
+        '%(texts)d texts predicted differently.' % report
+    print 'Table passed.' if report['passed'] else 'Table failed; spaCy will be used instead.'
@@ -0,0 +1,196 @@
+'''
+Approximate nearest-neighbour index over word vectors.
+
+Vectors are partitioned by spherical k-means into clusters
+stored contiguously. A query scores the cluster centroids,
+probes the closest clusters only, and re-ranks their members
+exactly by cosine similarity. Top-k and radius (similarity
+threshold) queries are supported. Probing every cluster makes
+a query exact.
+
+An index is saved as a directory of .npy files plus the word
+keys, and its vectors are memory-mapped on load.
+
+To build one from the spaCy vocabulary:
+
+    python vector_index.py pickles/vocab_index
+'''
+import os
+import sys
+import json
+import numpy as np
+
+FILES = ('vectors.npy', 'centroids.npy', 'offsets.npy')
+
+
+def unit_rows(matrix):
+    '''
+    Scales every row of a matrix to unit length,
+    leaving all-zero rows as they are.
+    '''
+    norms = np.linalg.norm(matrix, axis=1)
+    norms[norms == 0] = 1
+    return matrix / norms[:, None]
+
+
+def spherical_kmeans(vectors, clusters, iterations=10, seed=0):
+    '''
+    Clusters unit vectors by cosine similarity.
+
+    :param vectors: Array of unit row vectors.
+    :param clusters: Number of clusters.
+    :param iterations: Rounds of reassignment.
+    :param seed: Seed for the initial centroids.
+    :return: Array of unit centroids.
+    '''
+    random = np.random.RandomState(seed)
+    centroids = vectors[random.choice(len(vectors), clusters, replace=False)]
+    for i in range(iterations):
+        labels = np.argmax(np.dot(vectors, centroids.T), axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = ~sums.any(axis=1)
+        # Reseed clusters that lost all their members.
+        sums[empty] = vectors[random.choice(len(vectors), empty.sum())]
+        centroids = unit_rows(sums)
+    return centroids
+
+
+class VectorIndex():
+    """
+    Cluster-partitioned index of unit vectors, rows of the same
+    cluster stored together. Cluster c holds rows
+    offsets[c] to offsets[c + 1].
+    """
+
+    def __init__(self, keys, vectors, centroids, offsets):
+        """
+        :param keys: Key (word) of every row.
+        :param vectors: Unit row vectors, grouped by cluster.
+        :param centroids: Unit centroid of every cluster.
+        :param offsets: Start row of every cluster, plus the row count.
+        """
+        self.keys = keys
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = {k: i for i, k in enumerate(keys)}
+
+    @classmethod
+    def build(cls, keys, vectors, clusters=None, iterations=10, sample=50000, seed=0, chunk_size=20000):
+        """
+        Builds an index from raw vectors.
+
+        :param keys: Key of every vector.
+        :param vectors: Array of vectors, one row per key.
+        :param clusters: Number of clusters. Defaulted to about
+                         the square root of the number of vectors.
+        :param iterations: Rounds of k-means.
+        :param sample: Vectors k-means is trained on.
+        :param seed: Seed for sampling and initialization.
+        :param chunk_size: Vectors assigned to clusters at a time.
+        :return: The VectorIndex.
+        """
+        vectors = unit_rows(np.asarray(vectors, dtype=np.float32))
+        clusters = clusters or max(1, int(np.sqrt(len(vectors))))
+        random = np.random.RandomState(seed)
+        training = vectors[random.choice(len(vectors), min(sample, len(vectors)), replace=False)]
+        centroids = spherical_kmeans(training, min(clusters, len(training)), iterations, seed)
+        labels = np.concatenate([np.argmax(np.dot(vectors[i:i + chunk_size], centroids.T), axis=1)
+                                 for i in range(0, len(vectors), chunk_size)])
+        order = np.argsort(labels, kind='mergesort')
+        offsets = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        return cls([keys[i] for i in order], vectors[order], centroids, offsets)
+
+    @classmethod
+    def from_vocab(cls, vocab, **kwargs):
+        """
+        Builds an index of every lexeme with a vector in a spaCy vocabulary.
+
+        :param vocab: The spaCy Vocab.
+        :return: The VectorIndex.
+        """
+        lexemes = [w for w in vocab if w.has_vector]
+        return cls.build([w.orth_ for w in lexemes], np.array([w.vector for w in lexemes]), **kwargs)
+
+    def save(self, directory):
+        """
+        :param directory: Directory to write the index to.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, array in zip(FILES, (self.vectors, self.centroids, self.offsets)):
+            np.save(os.path.join(directory, name), array)
+        with open(os.path.join(directory, 'keys.json'), 'w') as f:
+            json.dump(list(self.keys), f)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads a saved index, memory-mapping its vectors.
+
+        :param directory: Directory the index was saved to.
+        :return: The VectorIndex.
+        """
+        vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        centroids = np.load(os.path.join(directory, 'centroids.npy'))
+        offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        with open(os.path.join(directory, 'keys.json')) as f:
+            keys = json.load(f)
+        return cls(keys, vectors, centroids, offsets)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def vector(self, key):
+        """
+        :return: The stored unit vector of key.
+        """
+        return np.asarray(self.vectors[self.rows[key]])
+
+    def candidates(self, query, probes):
+        # Rows of the clusters closest to the query, and their similarities.
+        query = np.asarray(query, dtype=np.float32)
+        length = np.linalg.norm(query)
+        if not length:
+            return np.array([], dtype=int), np.array([], dtype=np.float32)
+        query = query / length
+        probes = len(self.centroids) if probes is None else min(probes, len(self.centroids))
+        closest = np.argsort(-np.dot(self.centroids, query))[:probes]
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in closest])
+        return rows, np.dot(self.vectors[rows], query)
+
+    def top_k(self, query, k=10, probes=8):
+        """
+        :param query: Query vector.
+        :param k: Number of neighbours.
+        :param probes: Clusters to search, or None for all (exact).
+        :return: List of (key, similarity), most similar first.
+        """
+        rows, similarity = self.candidates(query, probes)
+        if len(rows) > k:
+            best = np.argpartition(-similarity, k)[:k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-similarity[best])]
+        return [(self.keys[rows[i]], float(similarity[i])) for i in best]
+
+    def radius(self, query, threshold, probes=8):
+        """
+        :param query: Query vector.
+        :param threshold: Least cosine similarity to report.
+        :param probes: Clusters to search, or None for all (exact).
+        :return: List of (key, similarity), most similar first.
+        """
+        rows, similarity = self.candidates(query, probes)
+        hits = np.flatnonzero(similarity >= threshold)
+        hits = hits[np.argsort(-similarity[hits])]
+        return [(self.keys[rows[i]], float(similarity[i])) for i in hits]
+
+
+if __name__ == '__main__':
+    import en_vectors_glove_md as spacy_model
+    VectorIndex.from_vocab(spacy_model.load().vocab).save(sys.argv[1])